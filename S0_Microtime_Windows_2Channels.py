@@ -2,7 +2,8 @@ import os
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
-from scripts.Read_PTU import read_data
+from scripts.Read_PTU import read_header, time_resolution
+from scripts.Microtime_Histograms import folder_histogram, microtime_counts
 from datetime import datetime
 import json
 
@@ -14,6 +15,8 @@ DONOR_CHANNEL = 2 # detection channel of the donor signal
 ACCEPTOR_CHANNEL = 1 # detection channel of the acceptor signal
 
 NUM_CHANNELS = 0 # number of microtime channels - gets calculated from data files if zero
+
+MAX_T = 0 # (s) only the first MAX_T seconds of every file are used for the histograms, 0 -> whole files
 #########################################################################################
 
 mpl.use('TkAgg') # uses external plotting
@@ -21,8 +24,10 @@ mpl.use('TkAgg') # uses external plotting
 # search for HT3-files
 contPath = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.ptu')]
 
-# read first file
-data, unit, globRes, binRes = read_data(DATA_FOLDER + '/' + contPath[0])
+# resolutions from the header of the first file
+header = read_header(DATA_FOLDER + '/' + contPath[0])
+
+globRes, binRes = time_resolution(header) # (s) sync period and microtime resolution (synthetic PIE period for T2 data)
 
 dt = np.round(binRes*1e12).astype(int) # (ps) temporal resolution of microtime channels
 
@@ -30,15 +35,14 @@ if NUM_CHANNELS == 0:
 
     NUM_CHANNELS = np.round(globRes/binRes).astype(int)
 
-# separate channels
-microD = data[data[:, 0] == DONOR_CHANNEL, 1]
-microA = data[data[:, 0] == ACCEPTOR_CHANNEL, 1]
+# microtime histograms of all detection channels summed over all files (cached per file)
+hist = folder_histogram(DATA_FOLDER, MAX_T)
 
 edges = np.arange(1, NUM_CHANNELS)
 
-# calculate microtime histograms
-hD, _ = np.histogram(microD, bins=np.append(edges, edges[-1] + 1))
-hA, _ = np.histogram(microA, bins=np.append(edges, edges[-1] + 1))
+# separate channels
+hD = microtime_counts(hist, DONOR_CHANNEL, edges)
+hA = microtime_counts(hist, ACCEPTOR_CHANNEL, edges)
 
 
 # Histogram plotting
@@ -103,8 +107,6 @@ timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 figpath = os.path.join("settings", f"Selected_time_windows_{timestamp}.png")
 f1.savefig(figpath)
 
-dt = np.round(binRes*1e12).astype(int)
-
 settings_arr = np.round([*xFRET, *xACC]).astype(int)
 settings_dict = {'FRET': settings_arr[:2].tolist(), 'Acceptor': settings_arr[2:].tolist(), 'Channels': NUM_CHANNELS.tolist(), 'dt': dt.tolist(), 'Donor_channel': DONOR_CHANNEL, 'Acceptor_channel': ACCEPTOR_CHANNEL}
 
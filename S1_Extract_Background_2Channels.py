@@ -2,7 +2,11 @@ import os
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
-from scripts.Read_PTU import read_data
+from scripts.Read_PTU import read_photons
+from scripts.Photon_Streams import sync_counts, bin_trace, stream_lut, partition_photons
+from scripts.Background_Functions import background_file, background_summary
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import json
 
 # PARAMETER
@@ -11,7 +15,16 @@ DATA_FOLDER = "20250926_hpT5_100mM_NaCl_PTU"
 
 SETTINGS_FILE = "Settings_20251001_214343"
 
+AUTO_BG = 1 # 1 -> automatic background estimation from the burst-excluded bins of all files, 0 -> manual selection of background regions
+
 BIN_T = 1  # (ms) bin time to calculate time trace
+
+# automatic background estimation
+SEG_T = 10 # (s) length of the time segments with separate background values
+NUM_WORKERS = 4 # number of parallel worker processes (one file per worker)
+SAVE_SEGMENTS = 0 # additionally save the background values of every file and time segment
+
+# manual selection of background regions
 FRAC_T = 0.5  # (s) trace part to be analyzed
 NUM_F = 5 # number of files ...
 REG_F = 10 # ... and number of regions per file for background estimation
@@ -31,116 +44,160 @@ BRD_ACC = settings['Acceptor'] # microtime borders for acceptor check
 DONOR_CHANNEL = settings['Donor_channel'] # channel of the donor signal
 ACCEPTOR_CHANNEL = settings['Acceptor_channel'] # channel of the acceptor signal
 
+lut = stream_lut(BRD_FRET, BRD_ACC, DONOR_CHANNEL, ACCEPTOR_CHANNEL) # (channel, microtime) -> photon stream
+
 # Load measurement folder
 FOLDER = os.path.basename(DATA_FOLDER)
 
 contPath = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.ptu')]
 
-# start collection of background regions
-f1, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 5))
+if __name__ == '__main__': # worker processes import this file without running the background estimation
+
+    if AUTO_BG:
+
+        print('Automatic background estimation running...')
+
+        filePaths = [DATA_FOLDER + '/' + fname for fname in contPath]
+
+        # background of every file from its burst-excluded bins, results in file order
+        with ProcessPoolExecutor(NUM_WORKERS) as pool:
+            results = list(pool.map(background_file, filePaths, repeat(lut), repeat(BIN_T), repeat(SEG_T)))
+
+        background_dict = background_summary(results)
+
+        if SAVE_SEGMENTS:
+            background_dict['SEG_T'] = SEG_T
+            background_dict['files'] = {fname: {key: np.asarray(r[key]).tolist() for key in r} for fname, r in zip(contPath, results)}
+
+        # background of all time segments
+        f1, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 5))
+
+        for key, color in [('BD', (0, 0.75, 0)), ('BA', (0.75, 0, 0)), ('BA0', (0.75, 0, 0.75))]:
+
+            seg = np.concatenate([r[f'{key}_seg'] for r in results])
+
+            ax1.plot(np.arange(len(seg)) * SEG_T, seg, '.', color=color)
+            ax2.hist(seg[~np.isnan(seg)], bins=20, histtype='step', color=color)
+
+        ax1.set_xlabel('time segments of all files (s)')
+        ax1.set_ylabel('background (kHz)')
+        ax2.set_xlabel('background (kHz)')
+        ax2.set_ylabel('number of events')
+
+    else:
+
+        # start collection of background regions
+        f1, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 5))
+
+        arrBD, arrBA, arrBA0, arrL = [], [], [], []
+
+        REG_F = REG_F + 1
+
+        for iterF in range(NUM_F):
 
-arrBD, arrBA, arrBA0, arrL = [], [], [], []
+            idx = iterF * len(contPath) // NUM_F
 
-REG_F = REG_F + 1
+            photons, unit, globRes, binRes = read_photons(DATA_FOLDER + '/' + contPath[idx])
 
-for iterF in range(NUM_F):
+            streams = partition_photons(photons, lut)
 
-    idx = iterF * len(contPath) // NUM_F
+            nsync = photons['nsync']
 
-    data, unit, globRes, binRes = read_data(DATA_FOLDER + '/' + contPath[idx])
+            # photon macrotimes
+            macroAll = nsync[streams['All']] # (sync)
+            macroD = nsync[streams['D']] # (sync)
+            macroA = nsync[streams['A']] # (sync)
+            macroA0 = nsync[streams['A0']]  # (sync)
 
-    # photon macrotimes
-    macroAll = data[(((BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1])) | ((BRD_ACC[0] < data[:, 1]) & (data[:, 1] < BRD_ACC[1]))), 2] * 1e-6 # (ms)
-    macroD = data[(BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1]) & (data[:, 0] == DONOR_CHANNEL), 2] * 1e-6 # (ms)
-    macroA = data[(BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1]) & (data[:, 0] == ACCEPTOR_CHANNEL), 2] * 1e-6 # (ms)
-    macroA0 = data[(BRD_ACC[0] < data[:, 1]) & (data[:, 1] < BRD_ACC[1]) & (data[:, 0] == ACCEPTOR_CHANNEL), 2] * 1e-6  # (ms)
+            # signal intensities
+            BIN_S = sync_counts(BIN_T, globRes) # (sync) bin time
+            numBins = int((macroAll[-1] - macroAll[0]) // BIN_S) + 1
 
-    # signal intensities
-    edges = np.arange(macroAll[0], macroAll[-1] + BIN_T, BIN_T) # (ms)
+            edges = (int(macroAll[0]) + BIN_S * np.arange(numBins + 1)) * globRes * 1e3 # (ms)
 
-    I_All, _ = np.histogram(macroAll, bins=edges) # (kHz)
+            I_All = bin_trace(macroAll, BIN_S, macroAll[0], numBins) # (kHz)
 
-    I_D, _ = np.histogram(macroD, bins=edges) # (kHz)
-    I_A, _ = np.histogram(macroA, bins=edges) # (kHz)
-    I_A0, _ = np.histogram(macroA0, bins=edges)  # (kHz)
+            I_D = bin_trace(macroD, BIN_S, macroAll[0], numBins) # (kHz)
+            I_A = bin_trace(macroA, BIN_S, macroAll[0], numBins) # (kHz)
+            I_A0 = bin_trace(macroA0, BIN_S, macroAll[0], numBins)  # (kHz)
 
-    measT = macroAll[-1] # total measurement time in milliseconds
-    numT = int(np.floor(measT / (FRAC_T * 1000))) # number of time windows of current trace
+            measT = int(macroAll[-1]) * globRes * 1e3 # total measurement time in milliseconds
+            numT = int(np.floor(measT / (FRAC_T * 1000))) # number of time windows of current trace
 
-    for iterR in range(1, min(numT, REG_F)):
+            for iterR in range(1, min(numT, REG_F)):
 
-        sel_edges = edges[((iterR * FRAC_T * 1000) < edges) & (edges < ((iterR + 1) * FRAC_T * 1000))] / 1000 # (s)
-        sel_I_All = I_All[((iterR * FRAC_T * 1000) < edges[0:-1]) & (edges[0:-1] < ((iterR + 1) * FRAC_T * 1000))] # (kHz)
+                sel_edges = edges[((iterR * FRAC_T * 1000) < edges) & (edges < ((iterR + 1) * FRAC_T * 1000))] / 1000 # (s)
+                sel_I_All = I_All[((iterR * FRAC_T * 1000) < edges[0:-1]) & (edges[0:-1] < ((iterR + 1) * FRAC_T * 1000))] # (kHz)
 
-        # manual pick of background region
-        if iterR > 1:
-            line.remove()
+                # manual pick of background region
+                if iterR > 1:
+                    line.remove()
 
-        ax1.cla()
-        line, = ax1.plot(sel_edges, sel_I_All, color=(0, 0, 0.75))
-        ax1.set_xlim(sel_edges[0], sel_edges[-1])
-        ax1.set_ylim(0, 100)
-        ax1.set_xlabel('macrotime (s)')
-        ax1.set_ylabel('total intenisty (kHz)')
+                ax1.cla()
+                line, = ax1.plot(sel_edges, sel_I_All, color=(0, 0, 0.75))
+                ax1.set_xlim(sel_edges[0], sel_edges[-1])
+                ax1.set_ylim(0, 100)
+                ax1.set_xlabel('macrotime (s)')
+                ax1.set_ylabel('total intenisty (kHz)')
 
-        # Range selection
-        xB = plt.ginput(2)
-        xB = [x[0] for x in xB]
+                # Range selection
+                xB = plt.ginput(2)
+                xB = [x[0] for x in xB]
 
-        arrBD.append(mean_bin_counts(xB[0], xB[1], I_D, edges))
-        arrBA.append(mean_bin_counts(xB[0], xB[1], I_A, edges))
-        arrBA0.append(mean_bin_counts(xB[0], xB[1], I_A0, edges))
-        arrL.append(xB[1] - xB[0])
+                arrBD.append(mean_bin_counts(xB[0], xB[1], I_D, edges))
+                arrBA.append(mean_bin_counts(xB[0], xB[1], I_A, edges))
+                arrBA0.append(mean_bin_counts(xB[0], xB[1], I_A0, edges))
+                arrL.append(xB[1] - xB[0])
 
-        print(f'{iterR}/{min(numT, REG_F) - 1} regions')
+                print(f'{iterR}/{min(numT, REG_F) - 1} regions')
 
-    print(f'{iterF + 1}/{NUM_F} files processed')
+            print(f'{iterF + 1}/{NUM_F} files processed')
 
-    edgesBG_D = np.arange(0, max(arrBD) + 4*max(arrBD)/10, max(arrBD)/10)  # (kHz)
-    edgesBG_A = np.arange(0, max(arrBA) + 4*max(arrBA)/10, max(arrBA) / 10)  # (kHz)
-    edgesBG_A0 = np.arange(0, max(arrBA0) + 4*max(arrBA0)/10, max(arrBA0) / 10)  # (kHz)
+            edgesBG_D = np.arange(0, max(arrBD) + 4*max(arrBD)/10, max(arrBD)/10)  # (kHz)
+            edgesBG_A = np.arange(0, max(arrBA) + 4*max(arrBA)/10, max(arrBA) / 10)  # (kHz)
+            edgesBG_A0 = np.arange(0, max(arrBA0) + 4*max(arrBA0)/10, max(arrBA0) / 10)  # (kHz)
 
-    hBD, _ = np.histogram(arrBD, bins=edgesBG_D)  # (kHz)
-    hBA, _ = np.histogram(arrBA, bins=edgesBG_A)  # (kHz)
-    hBA0, _ = np.histogram(arrBA0, bins=edgesBG_A0)  # (kHz)
+            hBD, _ = np.histogram(arrBD, bins=edgesBG_D)  # (kHz)
+            hBA, _ = np.histogram(arrBA, bins=edgesBG_A)  # (kHz)
+            hBA0, _ = np.histogram(arrBA0, bins=edgesBG_A0)  # (kHz)
 
-    ax2.cla()
-    ax2.step(edgesBG_D[1:], hBD, where='post', color=(0, 0.75, 0))
-    ax2.step(edgesBG_A[1:], hBA, where='post', color=(0.75, 0, 0))
-    ax2.step(edgesBG_A0[1:], hBA0, where='post', color=(0.75, 0, 0.75))
-    ax2.set_xlim(0, max(max(arrBD), max(arrBA), max(arrBA0)))
-    ax2.set_xlabel('background (kHz)')
-    ax2.set_ylabel('number of events')
+            ax2.cla()
+            ax2.step(edgesBG_D[1:], hBD, where='post', color=(0, 0.75, 0))
+            ax2.step(edgesBG_A[1:], hBA, where='post', color=(0.75, 0, 0))
+            ax2.step(edgesBG_A0[1:], hBA0, where='post', color=(0.75, 0, 0.75))
+            ax2.set_xlim(0, max(max(arrBD), max(arrBA), max(arrBA0)))
+            ax2.set_xlabel('background (kHz)')
+            ax2.set_ylabel('number of events')
 
-arrBD = np.array(arrBD)
-arrBA = np.array(arrBA)
-arrBA0 = np.array(arrBA0)
+        arrBD = np.array(arrBD)
+        arrBA = np.array(arrBA)
+        arrBA0 = np.array(arrBA0)
 
-BD_mean = np.average(arrBD, weights=arrL)
-BA_mean = np.average(arrBA, weights=arrL)
-BA0_mean = np.average(arrBA0, weights=arrL)
+        BD_mean = np.average(arrBD, weights=arrL)
+        BA_mean = np.average(arrBA, weights=arrL)
+        BA0_mean = np.average(arrBA0, weights=arrL)
 
-BD_std = np.sqrt(np.average((arrBD - BD_mean) ** 2, weights=arrL))
-BA_std = np.sqrt(np.average((arrBA - BA_mean) ** 2, weights=arrL))
-BA0_std = np.sqrt(np.average((arrBA0 - BA0_mean) ** 2, weights=arrL))
+        BD_std = np.sqrt(np.average((arrBD - BD_mean) ** 2, weights=arrL))
+        BA_std = np.sqrt(np.average((arrBA - BA_mean) ** 2, weights=arrL))
+        BA0_std = np.sqrt(np.average((arrBA0 - BA0_mean) ** 2, weights=arrL))
 
-background_dict = {
-    'BD_mean': BD_mean,
-    'BD_std': BD_std,
-    'BA_mean': BA_mean,
-    'BA_std': BA_std,
-    'BA0_mean': BA0_mean,
-    'BA0_std': BA0_std
-}
+        background_dict = {
+            'BD_mean': BD_mean,
+            'BD_std': BD_std,
+            'BA_mean': BA_mean,
+            'BA_std': BA_std,
+            'BA0_mean': BA0_mean,
+            'BA0_std': BA0_std
+        }
 
-if not os.path.exists("results"):
-    os.makedirs("results")
+    if not os.path.exists("results"):
+        os.makedirs("results")
 
-background_path = os.path.join("results", f"BG_{FOLDER}.json")
+    background_path = os.path.join("results", f"BG_{FOLDER}.json")
 
-with open(background_path, 'w') as f:
-    json.dump(background_dict, f, indent=4)
+    with open(background_path, 'w') as f:
+        json.dump(background_dict, f, indent=4)
 
-print(background_dict)
+    print(background_dict)
 
-plt.show()
\ No newline at end of file
+    plt.show()
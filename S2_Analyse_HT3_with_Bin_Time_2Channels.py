@@ -1,10 +1,14 @@
 import os
 import numpy as np
 import matplotlib as mpl
-from scripts.To_CDE_Functions import FRET_2CDE, ALEX_2CDE
-from scripts.Read_PTU import read_data
+from scripts.Read_PTU import read_headers, header_summary
+from scripts.Burst_Functions import limit_memory
+from scripts.Result_Cache import content_hashes, result_folder, analyse_file_cached
+from scripts.Lifetime_MLE import cached_models
+from scripts.Results_IO import RESULT_COLUMNS, concat_blocks, save_results, save_results_json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from alive_progress import alive_bar
-import time
 import json
 
 # PARAMETER
@@ -20,252 +24,161 @@ ALGORITHM = 0 # 0 -> I_All >= THRE_B ... total intensity filter
               # 2 -> I_A0  >= THRE_B ... demanding active acceptor
               # 3 -> (I_D + I_A)  >= THRE_B ... demanding active donor
               # 4 -> I_D  >= THRE_B ... demanding donor counts
+              # 5 -> sliding window burst search on all photons, see APBS_M, APBS_T and APBS_L (BIN_T and THRE_B are not used)
+              # 6 -> dual-channel burst search: sliding window burst searches on the donor excitation (DD + DA) and on the
+              #      acceptor excitation (AA) photons, both have to be in a burst ... demanding active donor and active acceptor
+
+APBS_M = 10 # number of photons of the sliding window
+APBS_T = 0.5 # (ms) maximal duration of the M photons of a burst window
+APBS_L = 50 # minimal number of photons per burst
 
 MEAN_IRF_DONOR = 1.683 # (ns) mean lifetime of the donor IRF
 MEAN_IRF_ACCEPTOR = 22.5871 # (ns) mean lifetime of the acceptor IRF
-#########################################################################
-
-mpl.use('TkAgg') # uses external plotting
-
-# makes it possible to save np arrays in json format
-class NumpyEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return super().default(obj)
-
-# Load settings
-with open(os.path.join("settings", f"{SETTINGS_FILE}.json"), 'r') as f:
-    settings = json.load(f)
-
-def histc(x, edges):
-
-    x = np.asarray(x)
-    edges = np.asarray(edges)
-
-    # create histogram counts
-    counts, _ = np.histogram(x, bins=edges)
-
-    # copying MATLAB handling of the last bin
-    last_bin_count = np.sum(x == edges[-1])
-    counts = np.append(counts, last_bin_count)
-
-    bins = np.digitize(x, edges, right=True)
-
-    return counts, bins
 
-BRD_FRET = settings['FRET'] # microtime borders for FRET
-BRD_ACC = settings['Acceptor'] # microtime borders for acceptor check
-NUM_CH = settings['Channels'] # number of non-zero microtime channels
-DT_BIN = settings['dt'] # (ps) microtime resolution per channel
-DONOR_CHANNEL = settings['Donor_channel'] # channel of the donor signal
-ACCEPTOR_CHANNEL = settings['Acceptor_channel'] # channel of the acceptor signal
+TAU_METHOD = 0 # 0 -> mean microtime minus mean IRF delay, 1 -> burst-wise maximum likelihood fit of IRF convolved decays
+IRF_FILE = "IRF_20251029_180431" # IRF histograms saved by SX2 for TAU_METHOD = 1
 
-MID_CH = round(NUM_CH/2)
+NUM_WORKERS = 1 # number of parallel worker processes (one file per worker), 1 -> serial analysis
+MAX_WORKER_MEM = 0 # (GB) memory limit per worker process, 0 -> no limit
 
-# Load measurement folder
-FOLDER = os.path.basename(DATA_FOLDER)
+BVA_N = 5 # number of donor excitation photons per window of the burst variance analysis
 
-contPath = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.ptu')]
+USE_CACHE = True # reuse the burst tables of unchanged files analysed with the same parameters and settings
 
-numF = len(contPath)
-
-# arrays to collect the data
-data_BN = np.empty((0,), dtype=int)
-data_PosT = np.empty((0,), dtype=float)
-data_BIN_T = np.empty((0,), dtype=float)
-data_ID = np.empty((0,), dtype=int)
-data_IA = np.empty((0,), dtype=int)
-data_IA0 = np.empty((0,), dtype=int)
-data_TauD = np.empty((0,), dtype=float)
-data_TauA0 = np.empty((0,), dtype=float)
-data_FRET2CDE = np.empty((0,), dtype=float)
-data_ALEX2CDE = np.empty((0,), dtype=float)
-data_DTGR_TR0 = np.empty((0,), dtype=float)
-
-BN = 1
-
-print(' ')
-print('=====================================================')
-print('Burst analysis running...')
-
-with alive_bar(numF, force_tty=True) as bar:
-
-    for iterF in range(numF):
-
-        data, unit, globRes, binRes = read_data(DATA_FOLDER + '/' + contPath[iterF])
-
-        # photon arrival times -> macrotimes
-        macroAll = data[(((BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1])) | ((BRD_ACC[0] < data[:, 1]) & (data[:, 1] < BRD_ACC[1]))), 2] * 1e-6 # (ms)
-        macroD = data[(BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1]) & (data[:, 0] == DONOR_CHANNEL), 2] * 1e-6 # (ms)
-        macroA = data[(BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1]) & (data[:, 0] == ACCEPTOR_CHANNEL), 2] * 1e-6  # (ms)
-        macroA0 = data[(BRD_ACC[0] < data[:, 1]) & (data[:, 1] < BRD_ACC[1]) & (data[:, 0] == ACCEPTOR_CHANNEL), 2] * 1e-6  # (ms)
-
-        macroDA = data[(BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1]) & ((data[:, 0] == DONOR_CHANNEL) | (data[:, 0] == ACCEPTOR_CHANNEL)), 2] * 1e-6  # (ms)
-
-        # photon delay times -> microtimes
-        microD = data[(BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1]) & (data[:, 0] == DONOR_CHANNEL), 1] * DT_BIN * 1e-3  # (ns)
-        microA0 = data[(BRD_ACC[0] < data[:, 1]) & (data[:, 1] < BRD_ACC[1]) & (data[:, 0] == ACCEPTOR_CHANNEL), 1] * DT_BIN * 1e-3  # (ns)
+EXPORT_JSON = 0 # additionally export the results as json file
+#########################################################################
 
-        lenT = (macroAll[-1] - macroAll[0]) / 1000 # (s)
+mpl.use('TkAgg') # uses external plotting
 
-        edges = np.arange(0, macroAll[-1], BIN_T) # (ms)
+if __name__ == '__main__': # worker processes import this file without running the analysis
 
-        # calculate histograms
-        I_D, _ = histc(macroD, edges)
-        I_A, _ = histc(macroA, edges)
-        I_A0, _ = histc(macroA0, edges)
+    # Load settings
+    with open(os.path.join("settings", f"{SETTINGS_FILE}.json"), 'r') as f:
+        settings = json.load(f)
 
-        I_All = I_D + I_A + I_A0 # (kHz) total intensity
+    NUM_CH = settings['Channels'] # number of non-zero microtime channels
 
-        # algorithm for threshold filter to identify fluorescence bursts
-        if ALGORITHM == 0:
+    MID_CH = round(NUM_CH/2)
 
-            idx = I_All >= THRE_B
+    # parameters of the burst analysis of every file
+    config = dict(settings, BIN_T=BIN_T, THRE_B=THRE_B, ALGORITHM=ALGORITHM, APBS_M=APBS_M, APBS_T=APBS_T, APBS_L=APBS_L,
+                  MEAN_IRF_DONOR=MEAN_IRF_DONOR, MEAN_IRF_ACCEPTOR=MEAN_IRF_ACCEPTOR, TAU_METHOD=TAU_METHOD, BVA_N=BVA_N)
 
-        elif ALGORITHM == 1:
+    if TAU_METHOD == 1:
 
-            idx = ((I_D + I_A) >= THRE_B) & (I_A0  >= THRE_B)
+        # decay models on the lifetime grid, computed once for the IRF and cached
+        irf = np.load(os.path.join("settings", f"{IRF_FILE}.npz"))
 
-        elif ALGORITHM == 2:
+        if irf['Edges_Donor'][0] != settings['FRET'][0] or irf['Edges_Acceptor'][0] != settings['Acceptor'][0] \
+                or len(irf['Edges_Donor']) != np.diff(settings['FRET'])[0] or len(irf['Edges_Acceptor']) != np.diff(settings['Acceptor'])[0]:
+            print('ERROR: microtime windows of the IRF file differ from the settings!')
+            exit(0)
 
-            idx = I_A0  >= THRE_B
+        config['MODELS_D'] = cached_models(irf['IRF_Donor'], settings['dt'])
+        config['MODELS_A0'] = cached_models(irf['IRF_Acceptor'], settings['dt'])
 
-        elif ALGORITHM == 3:
+    # Load measurement folder
+    FOLDER = os.path.basename(DATA_FOLDER)
 
-            idx = (I_D + I_A)  >= THRE_B
+    contPath = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.ptu')]
 
-        elif ALGORITHM == 4:
+    numF = len(contPath)
 
-            idx = I_D  >= THRE_B
+    # consistency check of all files from their (cached) headers
+    summary = header_summary(read_headers(DATA_FOLDER))
 
-        posB = np.where(idx == 1)[0] # burst positions
-        numB = len(posB) # number of bursts
+    if not summary['consistent']:
+        print('WARNING: files differ in resolution or record type!')
 
-        # collect microtime information inside bursts -> arrays of parameters
-        arrID = np.zeros(numB)
-        arrIA = np.zeros(numB)
-        arrIA0 = np.zeros(numB)
-        arrTauD = np.zeros(numB)
-        arrTauA0 = np.zeros(numB)
-        arrFRET2CDE = np.zeros(numB)
-        arrALEX2CDE = np.zeros(numB)
-        arrDTGR_TR0 = np.zeros(numB)
+    print(f"{summary['numFiles']} files, {summary['numRecords']} records, up to {summary['memoryFile'] / 1e6:.0f} MB per file")
 
-        arrPosT = np.zeros(numB)
+    # per-file blocks of the burst columns, concatenated once after the analysis
+    blocks = {key: [] for key in RESULT_COLUMNS}
 
-        for iterA in range(numB):
+    BN = 1
 
-            sub_macroAll = macroAll[(edges[posB[iterA]] <= macroAll) & (macroAll < (edges[posB[iterA]] + BIN_T))] # (ms)
-            sub_macroD = macroD[(edges[posB[iterA]] <= macroD) & (macroD < (edges[posB[iterA]] + BIN_T))] # (ms)
-            sub_macroA = macroA[(edges[posB[iterA]] <= macroA) & (macroA < (edges[posB[iterA]] + BIN_T))] # (ms)
-            sub_macroA0 = macroA0[(edges[posB[iterA]] <= macroA0) & (macroA0 < (edges[posB[iterA]] + BIN_T))]  # (ms)
+    print(' ')
+    print('=====================================================')
+    print(f'Burst analysis running ({NUM_WORKERS} worker(s))...')
 
-            sub_macroDA = macroDA[(edges[posB[iterA]] <= macroDA) & (macroDA < (edges[posB[iterA]] + BIN_T))] # (ms)
+    filePaths = [DATA_FOLDER + '/' + fname for fname in contPath]
 
-            sub_microD = microD[(edges[posB[iterA]] <= macroD) & (macroD < (edges[posB[iterA]] + BIN_T))]  # (ns)
-            sub_microA0 = microA0[(edges[posB[iterA]] <= macroA0) & (macroA0 < (edges[posB[iterA]] + BIN_T))]  # (ns)
+    # per-file burst tables in the cache, keyed by file content and analysis parameters
+    if USE_CACHE:
 
-            arrID[iterA] = len(sub_macroD)
-            arrIA[iterA] = len(sub_macroA)
-            arrIA0[iterA] = len(sub_macroA0)
+        cacheFolder = result_folder(config)
 
-            # fluorescence lifetime calculation
-            if len(sub_microD) == 0:
+        if not os.path.exists(cacheFolder):
+            os.makedirs(cacheFolder)
 
-                arrTauD[iterA] = np.nan
-            else:
-                arrTauD[iterA] = np.mean(sub_microD) - MEAN_IRF_DONOR  # (ns)
+        hashes = content_hashes(DATA_FOLDER)
+        cachePaths = [os.path.join(cacheFolder, f"{hashes[fname]}.npz") for fname in contPath]
 
-            if len(sub_microA0) == 0:
+        numCached = sum(os.path.exists(path) for path in cachePaths)
+        print(f'{numCached} of {numF} files from cache, {numF - numCached} files to analyse')
 
-                arrTauA0[iterA] = np.nan
-            else:
-                arrTauA0[iterA] = np.mean(sub_microA0) - MEAN_IRF_ACCEPTOR  # (ns)
+    else:
+        cachePaths = [None] * numF
 
-            # Photon density indicators
-            if (len(sub_macroA) == 0) or (len(sub_macroD) == 0):
+    pool = ProcessPoolExecutor(NUM_WORKERS, initializer=limit_memory, initargs=(MAX_WORKER_MEM,)) if NUM_WORKERS > 1 else None
 
-                arrFRET2CDE[iterA] = 0
+    # results arrive in file order, so burst numbers and positions do not depend on the number of workers
+    results = pool.map(analyse_file_cached, filePaths, cachePaths, repeat(config)) if pool else map(analyse_file_cached, filePaths, cachePaths, repeat(config))
 
-            else:
-                arrFRET2CDE[iterA] = FRET_2CDE(sub_macroA, sub_macroD, 0.045) # kernel size is taken from the paper
+    with alive_bar(numF, force_tty=True) as bar:
 
-            # Photon density indicators
-            if (len(sub_macroA0) == 0) or (len(sub_macroDA) == 0):
+        for iterF, (params, lenT) in enumerate(results):
 
-                arrALEX2CDE[iterA] = 100
+            numB = len(params['ID']) # number of bursts
 
-            else:
-                arrALEX2CDE[iterA] = ALEX_2CDE(sub_macroA0, sub_macroDA, 0.075) # kernel size is taken from the paper
+            # add the data of the file to the output blocks
+            blocks['BN'].append(np.arange(BN, BN + numB))
+            blocks['PosT'].append(params['PosT'] + iterF * lenT) # (s)
 
-            if (len(sub_macroA0) == 0):
+            for key in ['BIN_T', 'ID', 'IA', 'IA0', 'TauD', 'TauA0', 'FRET2CDE', 'ALEX2CDE', 'DTGR_TR0', 'BVA_W', 'BVA_E', 'BVA_SIGMA']:
+                blocks[key].append(params[key])
 
-                arrDTGR_TR0[iterA] = -9.9
+            BN = BN + numB # increase burst number
 
-            elif (len(sub_macroDA) == 0):
+            bar()
 
-                arrDTGR_TR0[iterA] = 9.9
-            else:
-                TR0_ = np.sum(sub_macroA0) / len(sub_macroA0)
-                TGR_ = np.sum(sub_macroDA) / len(sub_macroDA)
-                arrDTGR_TR0[iterA] = TGR_ - TR0_
+    if pool:
+        pool.shutdown()
 
-            arrPosT[iterA] = np.mean(sub_macroAll) / 1000 + iterF * lenT # (s)
+    print('...Burst analysis done!')
+    print('=====================================================')
 
-        # add data to output arrays
-        data_BN = np.concatenate([data_BN, np.arange(BN, BN + numB, dtype=int)])
-        data_PosT = np.concatenate([data_PosT, arrPosT])
-        data_BIN_T = np.concatenate([data_BIN_T, BIN_T * np.ones(numB)])
-        data_ID = np.concatenate([data_ID, arrID.astype(int)])
-        data_IA = np.concatenate([data_IA, arrIA.astype(int)])
-        data_IA0 = np.concatenate([data_IA0, arrIA0.astype(int)])
-        data_TauD = np.concatenate([data_TauD, arrTauD])
-        data_TauA0 = np.concatenate([data_TauA0, arrTauA0])
-        data_FRET2CDE = np.concatenate([data_FRET2CDE, arrFRET2CDE])
-        data_ALEX2CDE = np.concatenate([data_ALEX2CDE, arrALEX2CDE])
-        data_DTGR_TR0 = np.concatenate([data_DTGR_TR0, arrDTGR_TR0])
+    # generate dictionary from data blocks
+    dataOUT_dict = concat_blocks(blocks)
 
-        BN = BN + numB # increase burst number
+    settings['Algorithm'] = ALGORITHM
+    settings['Bin_T'] = BIN_T
+    settings['Threshold'] = THRE_B
 
-        time.sleep(0.05)
-        bar()
+    if ALGORITHM in [5, 6]:
+        settings['APBS'] = {'M': APBS_M, 'T': APBS_T, 'L': APBS_L}
+    settings['Mean_IRF_Donor'] = MEAN_IRF_DONOR
+    settings['Mean_IRF_Acceptor'] = MEAN_IRF_ACCEPTOR
+    settings['Tau_Method'] = TAU_METHOD
 
-print('...Burst analysis done!')
-print('=====================================================')
+    if TAU_METHOD == 1:
+        settings['IRF_File'] = IRF_FILE
 
-# generate dictionary from data arrays
-dataOUT_dict = {
-    'BN': data_BN,
-    'PosT': data_PosT,
-    'BIN_T': data_BIN_T,
-    'ID': data_ID,
-    'IA': data_IA,
-    'IA0': data_IA0,
-    'TauD': data_TauD,
-    'TauA0': data_TauA0,
-    'FRET2CDE': data_FRET2CDE,
-    'ALEX2CDE': data_ALEX2CDE,
-    'DTGR_TR0': data_DTGR_TR0,
-}
+    settings['BVA_N'] = BVA_N
 
-settings['Algorithm'] = ALGORITHM
-settings['Bin_T'] = BIN_T
-settings['Threshold'] = THRE_B
-settings['Mean_IRF_Donor'] = MEAN_IRF_DONOR
-settings['Mean_IRF_Acceptor'] = MEAN_IRF_ACCEPTOR
+    # save results as binary columns with the settings as metadata and the settings in json file
+    if not os.path.exists("results"):
+        os.makedirs("results")
 
-# save parameters in json file
-if not os.path.exists("results"):
-    os.makedirs("results")
+    results_path = os.path.join("results", f"Results_{FOLDER}")
+    settings_path = os.path.join("results", f"Settings_{FOLDER}.json")
 
-results_path = os.path.join("results", f"Results_{FOLDER}.json")
-settings_path = os.path.join("results", f"Settings_{FOLDER}.json")
+    save_results(results_path, dataOUT_dict, settings)
 
-with open(results_path, 'w') as f:
-    json.dump(dataOUT_dict, f, indent=4, cls=NumpyEncoder)
+    if EXPORT_JSON:
+        save_results_json(results_path, dataOUT_dict)
 
-with open(settings_path, 'w') as f:
-    json.dump(settings, f, indent=4)
+    with open(settings_path, 'w') as f:
+        json.dump(settings, f, indent=4)
 
-print('Data saved in result folder!')
+    print('Data saved in result folder!')
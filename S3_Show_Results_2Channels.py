@@ -1,13 +1,12 @@
 import os
-import tkinter as tk
 import numpy as np
 import matplotlib as mpl
-import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
-from tkinter import filedialog, Tk, messagebox
-import json
-from scripts.Scatter2Density import Scatter2Density
-import pandas as pd
+from matplotlib.widgets import RangeSlider
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from scripts.Results_Plots import PANELS, BVA_PANEL, load_result_files, scatter_densities, export_data, export_results
+from scripts.Results_Analysis import ResultsAnalysis
 
 # PARAMETER
 #########################################################################
@@ -43,264 +42,123 @@ BRD_TAU_A = np.array([-100, 100]) # lower and upper threshold of acceptor lifeti
 # settings for FRET histogram binning
 BIN_SIZE = 0.03
 OFFSET = 0.017
+
+BVA_BINS = 20 # number of proximity ratio bins of the burst variance analysis
+
+TUNE_FILTERS = 1 # 1 -> range sliders of the common burst filters below the result figure
+
+DENSITY_METHOD = 'grid' # density of the scatter plots: 'grid' -> binned density (fast), 'kde' -> exact Gaussian KDE (slow for many bursts)
+
+# batch export without plot window and question (Agg backend)
+HEADLESS = 0 # 1 -> exports all BATCH_FILES, 0 -> shows and asks for RESULTS_FILE
+BATCH_FILES = [] # results files of the headless export, [] -> RESULTS_FILE
+NUM_WORKERS = 4 # number of parallel processes of the headless export
 #########################################################################
 
-# dividing a by b without b=0 warning
-def div_array(a, b):
-    return np.divide(a, b, out=np.full_like(a, np.inf, dtype=float), where=b != 0)
-
-# makes it possible to save np arrays in json format
-class NumpyEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return super().default(obj)
-
-mpl.use('TkAgg') # uses external plotting
-
-# Load data
-BACKGROUND_FILE = os.path.join(RESULTS_PATH, f"BG_{RESULTS_FILE[8:]}.json")
-SETTINGS_FILE = os.path.join(RESULTS_PATH, f"Settings_{RESULTS_FILE[8:]}.json")
-
-# open data file
-with open(os.path.join(RESULTS_PATH, f"{RESULTS_FILE}.json"), 'r') as f:
-    results = json.load(f)
-
-# open corresponding background file
-with open(BACKGROUND_FILE, 'r') as f:
-    background = json.load(f)
-
-# open settings file
-with open(SETTINGS_FILE, 'r') as f:
-        settings = json.load(f)
-
-# load parameters from result file
-BN = np.array(results['BN']) # burst number
-PosT = np.array(results['PosT']) # (s)
-BIN_T = np.array(results['BIN_T']) # (ms)
-ID = np.array(results['ID']) # (kHz)
-IA = np.array(results['IA']) # (kHz)
-IA0 = np.array(results['IA0']) # (kHz)
-TauD = np.array(results['TauD']) # (ns)
-TauA0 = np.array(results['TauA0']) # (ns)
-FRET2CDE = np.array(results['FRET2CDE'])
-ALEX2CDE = np.array(results['ALEX2CDE'])
-DTGR_TR0 = np.array(results['DTGR_TR0']) # (ms)
-
-if not BN.any():
-
-    print('Results file is empty!')
-
-else:
-
-    # load background data
-    BD = background['BD_mean'] # (kHz)
-    BA = background['BA_mean'] # (kHz)
-    BA0 = background['BA0_mean'] # (kHz)
-
-    Nph = ID + IA + IA0 # (kHz) total number of photons
-
-    # background corrected fluorescence intensity
-    FD = ID - BIN_T * BD # (kHz)
-    FA = IA - BIN_T * BA # (kHz)
-    FA0 = IA0 - BIN_T * BA0 # (kHz)
-
-    ratioDA = np.log10(div_array(ID, IA) + 1e-10) # intensity ratio
-
-    # corrected FRET efficiency and stoichiometry
-    E = div_array((FA - ALPHA * FA0 - BETA * FD), (FA - ALPHA * FA0 - BETA * FD + GAMMA * FD))
-    S = div_array((FA - ALPHA * FA0 - BETA * FD + GAMMA * FD), (FA - ALPHA * FA0 - BETA * FD + GAMMA * FD + FA0))
-
-    # relative fluorescence lifetime of the donor
-    Rel_TauD = TauD / TAU_D0 # relative fluorescence lifetime of the donor
-
-    idx = (BRD_E[0] <= E) & (E <= BRD_E[1]) \
-          & (NUM_PH[0] <= Nph) & (Nph <= NUM_PH[1]) \
-          & (BRD_S[0] <= S) & (S <= BRD_S[1]) \
-          & (BRD_ALEX2CDE[0] <= ALEX2CDE) & (ALEX2CDE <= BRD_ALEX2CDE[1]) \
-          & (BRD_FRET2CDE[0] <= FRET2CDE) & (FRET2CDE <= BRD_FRET2CDE[1]) \
-          & (RATIO_NGNR[0] <= ratioDA) & (ratioDA <= RATIO_NGNR[1]) \
-          & (BRD_TAU_D[0] <= TauD) & (TauD <= BRD_TAU_D[1]) \
-          & (BRD_TAU_A[0] <= TauA0) & (TauA0 <= BRD_TAU_A[1])
-
-    # data filtering
-    sel_E = E[idx]
-    sel_S = S[idx]
-    sel_TauD = TauD[idx] # (ns)
-    sel_Rel_TauD = Rel_TauD[idx]
-    sel_TauA0 = TauA0[idx] # (ns)
-    sel_ALEX2CDE = ALEX2CDE[idx]
-    sel_FRET2CDE = FRET2CDE[idx]
-    sel_PosT = PosT[idx] # (s)
-
-    # edges for FRET efficiency histogram
-    edgesE = np.arange(-0.1 + OFFSET, 1.1 + OFFSET, BIN_SIZE)
-    hist_E, _ = np.histogram(sel_E, bins=np.append(edgesE, edgesE[-1] + BIN_SIZE))
-
-    # plotting of results
-    f1, axs = plt.subplots(2, 3, figsize=(16, 9), gridspec_kw={'wspace': 0.3, 'hspace': 0.3})
-    ax1, ax2, ax3, ax4, ax5, ax6 = axs.flatten()
-    f1.suptitle(RESULTS_FILE)
-
-    # Create a custom colormap: white -> red
-    cmap = LinearSegmentedColormap.from_list('white_red', ['white', 'red'])
-
-    # FRET efficiency vs. Stoichiometry plot
-    sel_E1, sel_S1, z_ES1 = Scatter2Density(sel_E, sel_S)
-
-    ax1.scatter(E, S, c='black', s=2)
-    ax1.scatter(sel_E1, sel_S1, c=z_ES1, s=7, cmap='jet')
-    ax1.set_xlim(-0.1, 1.1)
-    ax1.set_ylim(-0.1, 1.1)
-    ax1.set_xlabel('FRET efficiency, $E$')
-    ax1.set_ylabel('Stoichiometry, $S$')
-
-    # FRET efficiency vs. FRET-2CDE plot
-    sel_E2, sel_ALEX2CDE2, z_EA2E2 = Scatter2Density(sel_E, sel_ALEX2CDE)
-
-    ax2.scatter(E, ALEX2CDE, c='black', s=2)
-    ax2.scatter(sel_E2, sel_ALEX2CDE2, c=z_EA2E2, s=7, cmap='jet')
-    ax2.set_xlim(-0.1, 1.1)
-    ax2.set_ylim(0, 110)
-    ax2.set_xlabel('FRET efficiency, $E$')
-    ax2.set_ylabel('ALEX-2CDE')
-
-    # FRET efficiency vs. FRET-2CDE plot
-    sel_E3, sel_FRET2CDE3, z_EF2E3 = Scatter2Density(sel_E, sel_FRET2CDE)
-
-    ax3.scatter(sel_E3, sel_FRET2CDE3, c=z_EF2E3, s=7, cmap='jet')
-    ax3.set_xlim(-0.1, 1.1)
-    ax3.set_ylim(0, 110)
-    ax3.set_xlabel('FRET efficiency, $E$')
-    ax3.set_ylabel('FRET-2CDE')
-
-    # FRET efficiency histogram
-    ax4.hist(sel_E, bins=np.append(edgesE, edgesE[-1] + BIN_SIZE), color='skyblue', edgecolor='black')
-    ax4.set_xlim(-0.1, 1.1)
-    ax4.set_xlabel('FRET efficiency, $E$')
-    ax4.set_ylabel('Number of molecules')
-
-    # FRET efficiency vs. relative fluorescence lifetime of the donor
-    idx_number=~np.isnan(sel_Rel_TauD)
-    sel_En = sel_E[idx_number]
-    sel_Rel_TauDn = sel_Rel_TauD[idx_number] # NaN filtered molecules
-
-    sel_En5, sel_Rel_TauDn5, z_ETD5 = Scatter2Density(sel_En, sel_Rel_TauDn)
-
-    ax5.scatter(sel_En5, sel_Rel_TauDn5, c=z_ETD5, s=7, cmap='jet')
-    ax5.plot(np.array([0, 1]), np.array([1, 0]), color='black')
-    ax5.set_xlim(-0.1, 1.1)
-    ax5.set_ylim(-0.1, 1.1)
-    ax5.set_xlabel('FRET efficiency, $E$')
-    ax5.set_ylabel(r'$\tau_D / \tau_{D0}$')
-
-    # Fluorescence lifetime plots
-    edgesT = np.arange(0, 10, 0.1)
-    hist_TD_only, _ = np.histogram(TauD[S > 0.9], bins=np.append(edgesT, edgesT[-1] + 0.1))
-    hist_TA_only, _ = np.histogram(TauA0[S < 0.2], bins=np.append(edgesT, edgesT[-1] + 0.1))
-    hist_TD, _ = np.histogram(sel_TauD, bins=np.append(edgesT, edgesT[-1] + 0.1))
-
-    ax6.step(edgesT, hist_TD_only / np.max(hist_TD_only), where='post', color=(0, 0.75, 0))
-    ax6.step(edgesT, hist_TD / np.max(hist_TD), where='post', color=(0.75, 0.75, 0))
-    ax6.step(edgesT, hist_TA_only / np.max(hist_TA_only), where='post', color=(0.75, 0, 0))
-    ax6.set_xlim(0, 10)
-    ax6.set_xlabel(r'$\tau$ (ns)')
-    ax6.set_ylabel('number of events')
-    ax6.legend(['Donor only', 'Donor - FRET', 'Acceptor only'])
-
-    plt.show()
-
-    root = tk.Tk()
-    root.withdraw()  # Hide the main window
-
-    # ask for saving data
-    result = messagebox.askyesno("Confirm", "Do you want to save the results?")
-
-    if result:
-
-        # save parameters in json file
-        if not os.path.exists(PATH_OUT):
-            os.makedirs(PATH_OUT)
-
-        PATH_OUT_FOLDER = os.path.join(PATH_OUT, RESULTS_FILE[8:])
-
-        if not os.path.exists(PATH_OUT_FOLDER):
-            os.makedirs(PATH_OUT_FOLDER)
-
-        # extract and save plots
-        bbox1 = ax1.get_tightbbox(f1.canvas.get_renderer()).expanded(1.025, 1.025)
-        bbox2 = ax2.get_tightbbox(f1.canvas.get_renderer()).expanded(1.025, 1.025)
-        bbox3 = ax3.get_tightbbox(f1.canvas.get_renderer()).expanded(1.025, 1.025)
-        bbox4 = ax4.get_tightbbox(f1.canvas.get_renderer()).expanded(1.025, 1.025)
-        bbox5 = ax5.get_tightbbox(f1.canvas.get_renderer()).expanded(1.025, 1.025)
-        bbox6 = ax6.get_tightbbox(f1.canvas.get_renderer()).expanded(1.025, 1.025)
-
-        # transform to figure coordinate system
-        bbox1 = bbox1.transformed(f1.dpi_scale_trans.inverted())
-        bbox2 = bbox2.transformed(f1.dpi_scale_trans.inverted())
-        bbox3 = bbox3.transformed(f1.dpi_scale_trans.inverted())
-        bbox4 = bbox4.transformed(f1.dpi_scale_trans.inverted())
-        bbox5 = bbox5.transformed(f1.dpi_scale_trans.inverted())
-        bbox6 = bbox6.transformed(f1.dpi_scale_trans.inverted())
-
-        if boolPNG:
-
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "S_vs_E_scatter_plot.png"), bbox_inches=bbox1, dpi=300, format='png')
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "ALEX2CDE_vs_E_scatter_plot.png"), bbox_inches=bbox2, dpi=300, format='png')
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "FRET2CDE_vs_E_scatter_plot.png"), bbox_inches=bbox3, dpi=300, format='png')
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "E_histogram.png"), bbox_inches=bbox4, dpi=300, format='png')
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "RelTauD_vs_E_scatter_plot.png"), bbox_inches=bbox5, dpi=300, format='png')
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "Lifetime_histograms.png"), bbox_inches=bbox6, dpi=300, format='png')
-
-        if boolSVG:
-
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "S_vs_E_scatter_plot.svg"), bbox_inches=bbox1, format='svg')
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "ALEX2CDE_vs_E_scatter_plot.svg"), bbox_inches=bbox2, format='svg')
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "FRET2CDE_vs_E_scatter_plot.svg"), bbox_inches=bbox3, format='svg')
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "E_histogram.svg"), bbox_inches=bbox4, format='svg')
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "RelTauD_vs_E_scatter_plot.svg"), bbox_inches=bbox5,format='svg')
-            f1.savefig(os.path.join(PATH_OUT_FOLDER, "Lifetime_histograms.svg"), bbox_inches=bbox6, format='svg')
-
-        if boolEXCEL:
-
-            df = pd.DataFrame({
-                "time (s)": sel_PosT,
-                "E": sel_E,
-                "S": sel_S,
-                "Tau_D (ns)": sel_TauD,
-                "Tau_A0 (ns)": sel_TauA0,
-                "ALEX2CDE": sel_ALEX2CDE,
-                "FRET2CDE": sel_FRET2CDE
-            })
-
-            df.to_excel(os.path.join(PATH_OUT_FOLDER, "Results.xlsx"), index=False)
-
-        if (boolPNG | boolSVG | boolEXCEL):
-
-            # generate dictionary from data arrays
-            corr_filter_dict = {
-
-                'alpha': np.array([ALPHA]),
-                'beta' : np.array([BETA]),
-                'gamma' : np.array([GAMMA]),
-                'TauD0' : np.array([TAU_D0]),
-                'number_of_Photons' :NUM_PH,
-                'borders_S' : BRD_S,
-                'borders_ALEX2CDE' : BRD_ALEX2CDE,
-                'borders_E': BRD_E,
-                'borders_FRET2CDE': BRD_FRET2CDE,
-                'borders_NGNR': RATIO_NGNR,
-                'borders_TauD': BRD_TAU_D,
-                'borders_TauA': BRD_TAU_A,
-                'Bin_Size' : np.array([BIN_SIZE]),
-                'Offset' : np.array([OFFSET])
-            }
-
-            corr_filter_path = os.path.join(PATH_OUT_FOLDER, "CorrFilter_settings.json")
-            settings_path = os.path.join(PATH_OUT_FOLDER, "Analysis_settings.json")
-
-            with open(corr_filter_path, 'w') as f:
-                json.dump(corr_filter_dict, f, indent=4, cls=NumpyEncoder)
-
-            with open(settings_path, 'w') as f:
-                json.dump(settings, f, indent=4)
+mpl.use('Agg' if HEADLESS else 'TkAgg') # headless rendering or external plotting
+
+import matplotlib.pyplot as plt # after the backend selection
+
+# correction, filter, plot and export settings for the functions of Results_Plots
+params = {'RESULTS_PATH': RESULTS_PATH, 'PATH_OUT': PATH_OUT, 'boolPNG': boolPNG, 'boolSVG': boolSVG, 'boolEXCEL': boolEXCEL,
+          'ALPHA': ALPHA, 'BETA': BETA, 'GAMMA': GAMMA, 'TAU_D0': TAU_D0, 'NUM_PH': NUM_PH, 'BRD_S': BRD_S,
+          'BRD_ALEX2CDE': BRD_ALEX2CDE, 'BRD_E': BRD_E, 'BRD_FRET2CDE': BRD_FRET2CDE, 'RATIO_NGNR': RATIO_NGNR,
+          'BRD_TAU_D': BRD_TAU_D, 'BRD_TAU_A': BRD_TAU_A, 'BIN_SIZE': BIN_SIZE, 'OFFSET': OFFSET,
+          'BVA_BINS': BVA_BINS, 'DENSITY_METHOD': DENSITY_METHOD}
+
+if __name__ == '__main__':
+
+    if HEADLESS:
+
+        # one worker process per results file, every panel is rendered once per format
+        files = BATCH_FILES if BATCH_FILES else [RESULTS_FILE]
+
+        with ProcessPoolExecutor(max_workers=NUM_WORKERS) as pool:
+            for fname, numB in zip(files, pool.map(export_results, files, repeat(params))):
+                print(f"{fname}: {numB} bursts exported" if numB else f"{fname}: Results file is empty!")
+
+    else:
+
+        # tkinter is only needed for the question after the plot window (not available on every compute node)
+        import tkinter as tk
+        from tkinter import messagebox
+
+        # Load data - binary result folder (memory-mapped) or json file, background and settings file
+        results, background, settings = load_result_files(RESULTS_PATH, RESULTS_FILE)
+        params['BVA_N'] = settings.get('BVA_N') # photons per BVA window of S2
+
+        if not results['BN'].any():
+
+            print('Results file is empty!')
+
+        else:
+
+            # burst parameters kept in memory, filter changes update the selection incrementally
+            analysis = ResultsAnalysis(results, background, params)
+            data = analysis.data()
+            dens = scatter_densities(data, params)
+
+            # plotting of results
+            f1, axs = plt.subplots(2, 3, figsize=(16, 9), gridspec_kw={'wspace': 0.3, 'hspace': 0.3})
+            f1.suptitle(RESULTS_FILE)
+
+            # Create a custom colormap: white -> red
+            cmap = LinearSegmentedColormap.from_list('white_red', ['white', 'red'])
+
+            # burst variance analysis in a separate figure (results files of S2 with BVA columns only)
+            panels = list(zip(PANELS, axs.flatten()))
+
+            if 'BVA_SIGMA' in data:
+                f2, ax7 = plt.subplots(figsize=(16 / 3, 9 / 2))
+                f2.suptitle(RESULTS_FILE)
+                panels.append((BVA_PANEL, ax7))
+
+            def draw_panels():
+                for (name, plot), ax in panels:
+                    ax.clear()
+                    plot(ax, data, dens, params)
+
+            def update_filter(key, borders):
+
+                global data, dens
+
+                analysis.set_filter(key, borders)
+                params[key] = np.array(borders)
+
+                data = analysis.data()
+                dens = scatter_densities(data, params)
+
+                draw_panels()
+                for fig in {ax.figure for _, ax in panels}:
+                    fig.canvas.draw_idle()
+
+            draw_panels()
+
+            if TUNE_FILTERS:
+
+                # slider range: parameter range of the bursts and the initial borders
+                f1.subplots_adjust(bottom=0.2)
+                sliders = []
+
+                for i, (key, col) in enumerate([('NUM_PH', 'Nph'), ('BRD_S', 'S'), ('BRD_ALEX2CDE', 'ALEX2CDE')]):
+
+                    values = analysis.columns[col][np.isfinite(analysis.columns[col])]
+                    vmin = min(params[key][0], np.min(values, initial=0))
+                    vmax = max(params[key][1], np.max(values, initial=1))
+
+                    slider = RangeSlider(f1.add_axes([0.2, 0.1 - 0.035 * i, 0.6, 0.025]), key, vmin, vmax, valinit=tuple(params[key]))
+                    slider.on_changed(lambda borders, key=key: update_filter(key, borders))
+                    sliders.append(slider)
+
+            plt.show()
+
+            root = tk.Tk()
+            root.withdraw()  # Hide the main window
+
+            # ask for saving data
+            result = messagebox.askyesno("Confirm", "Do you want to save the results?")
+
+            if result:
+
+                # save plots, histograms and parameters (with the filter borders of the sliders)
+                export_data(data, dens, settings, params, os.path.join(PATH_OUT, RESULTS_FILE[8:]))
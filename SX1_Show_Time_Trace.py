@@ -3,7 +3,8 @@ import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
-from scripts.Read_PTU import read_data
+from scripts.Photon_Streams import stream_lut
+from scripts.Trace_Pyramid import build_pyramid, load_pyramid, view_level, view_trace
 import json
 
 # PARAMETER
@@ -12,7 +13,8 @@ DATA_FOLDER = "20240725HFRuler"
 
 SETTINGS_FILE = "Settings_20250930_215355"
 
-BIN_T = 1  # (ms) bin time to calculate time trace
+BIN_T = 1  # (ms) bin time of the finest time trace
+MAX_POINTS = 4000 # maximal number of bins per trace in the current view
 #########################################################################
 
 mpl.use('TkAgg') # uses external plotting
@@ -26,28 +28,13 @@ BRD_ACC = settings['Acceptor'] # microtime borders for acceptor check
 DONOR_CHANNEL = settings['Donor_channel'] # channel of the donor signal
 ACCEPTOR_CHANNEL = settings['Acceptor_channel'] # channel of the acceptor signal
 
-# Load measurement folder
-FOLDER = os.path.basename(DATA_FOLDER)
+# time trace pyramid of all files of the measurement folder - built once and stored in the cache folder
+lut = stream_lut(BRD_FRET, BRD_ACC, DONOR_CHANNEL, ACCEPTOR_CHANNEL)
 
-contPath = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.ptu')]
+meta, levels = load_pyramid(build_pyramid(DATA_FOLDER, lut, settings, BIN_T))
 
-data, unit, globRes, binRes = read_data(DATA_FOLDER + '/' + contPath[0])
-
-# photon macrotimes
-macroAll = data[(((BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1])) | ((BRD_ACC[0] < data[:, 1]) & (data[:, 1] < BRD_ACC[1]))), 2] * 1e-6 # (ms)
-
-macroD = data[(BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1]) & (data[:, 0] == DONOR_CHANNEL), 2] * 1e-6 # (ms)
-macroA = data[(BRD_FRET[0] < data[:, 1]) & (data[:, 1] < BRD_FRET[1]) & (data[:, 0] == ACCEPTOR_CHANNEL), 2] * 1e-6 # (ms)
-macroA0 = data[(BRD_ACC[0] < data[:, 1]) & (data[:, 1] < BRD_ACC[1]) & (data[:, 0] == ACCEPTOR_CHANNEL), 2] * 1e-6  # (ms)
-
-# signal intensities
-edges = np.arange(macroAll[0], macroAll[-1] + BIN_T, BIN_T) # (ms)
-
-I_D, _ = np.histogram(macroD, bins=edges) # (kHz)
-I_A, _ = np.histogram(macroA, bins=edges) # (kHz)
-I_A0, _ = np.histogram(macroA0, bins=edges)  # (kHz)
-
-I_All = I_D + I_A + I_A0
+lenT = len(levels['All'][0]['sum']) * BIN_T * 1e-3 # (s) length of all files
+fileT = np.array(meta['fileStart'][1:-1]) * BIN_T * 1e-3 # (s) file borders
 
 # start collection of background regions
 fig = plt.figure(figsize=(10, 4))
@@ -57,24 +44,54 @@ ax1 = fig.add_subplot(gs[0, :])
 ax2 = fig.add_subplot(gs[1, :])
 ax3 = fig.add_subplot(gs[2, :])
 
-ax1.plot(edges[1:], I_D, color=(0, 0.75, 0))
-ax1.plot(edges[1:], -I_A, color=(0.75, 0, 0))
-ax1.set_ylim(-1.1*np.max(I_A), 1.1*np.max(I_D))
-ax1.set_xticklabels([])
+ax1.set_ylim(-1.1*np.max(levels['A'][-1]['max']) / BIN_T, 1.1*np.max(levels['D'][-1]['max']) / BIN_T)
+ax1.tick_params(labelbottom=False)
 ax1.set_ylabel('I_D & I_A (kHz)')
 
-ax2.plot(edges[1:], I_A0, color=(0.75, 0, 0))
-ax2.set_ylim(0, 1.1*np.max(I_A0))
-ax2.set_xticklabels([])
+ax2.set_ylim(0, 1.1*np.max(levels['A0'][-1]['max']) / BIN_T)
+ax2.tick_params(labelbottom=False)
 ax2.set_ylabel('I_A0 (kHz)')
 
-ax3.plot(edges[1:], I_All, color=(0, 0, 0))
-ax3.set_ylim(0, 1.1*np.max(I_All))
+ax3.set_ylim(0, 1.1*np.max(levels['All'][-1]['max']) / BIN_T)
 ax3.set_ylabel('I_tot (kHz)')
-ax3.set_xlabel('macrotime (ms)')
+ax3.set_xlabel('macrotime (s)')
+
+for ax in [ax1, ax2, ax3]:
+    ax.vlines(fileT, 0, 1, transform=ax.get_xaxis_transform(), colors=(0.7, 0.7, 0.7), linewidth=0.5)
 
 ax1.sharex(ax2)
 ax2.sharex(ax1)
 ax3.sharex(ax1)
 
+# traces of the view: stream, axis, sign and color
+TRACES = [('D', ax1, 1, (0, 0.75, 0)), ('A', ax1, -1, (0.75, 0, 0)), ('A0', ax2, 1, (0.75, 0, 0)), ('All', ax3, 1, (0, 0, 0))]
+
+artists = []
+
+def draw_view(ax):
+
+    # fetches only the pyramid level of the current zoom and the bins inside of the view
+    t0, t1 = ax.get_xlim()
+    level = view_level(meta, t0, t1, MAX_POINTS)
+
+    for artist in artists:
+        artist.remove()
+    artists.clear()
+
+    for key, axT, sign, color in TRACES:
+
+        t, mean, low, high = view_trace(meta, levels, key, level, t0, t1)
+
+        if level > 0: # range of the base bins inside of every bin
+            artists.append(axT.fill_between(t, sign * low, sign * high, step='post', color=color, alpha=0.3, linewidth=0))
+
+        artists.extend(axT.step(t, sign * mean, where='post', color=color))
+
+    fig.canvas.draw_idle()
+
+ax3.set_xlim(0, lenT)
+draw_view(ax3)
+
+ax3.callbacks.connect('xlim_changed', draw_view)
+
 plt.show()
@@ -2,7 +2,7 @@ import os
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
-from scripts.Read_PTU import read_data
+from scripts.Microtime_Histograms import cached_histogram, microtime_counts
 import json
 
 # PARAMETER
@@ -34,21 +34,17 @@ DT_BIN = settings['dt'] # (ps) microtime resolution per channel
 DONOR_CHANNEL = settings['Donor_channel'] # channel of the donor signal
 ACCEPTOR_CHANNEL = settings['Acceptor_channel'] # channel of the acceptor signal
 
-# loading of the donor and acceptor IRF
-dataD, unitD, globResD, binResD = read_data(DATA_FOLDER + '/' + DATA_FILE_DONOR + '.ptu')
-dataA, unitA, globResA, binResA = read_data(DATA_FOLDER + '/' + DATA_FILE_ACCEPTOR + '.ptu')
-
-# microtime channels
-microD = dataD[(BRD_FRET[0] < dataD[:, 1]) & (dataD[:, 1] < BRD_FRET[1]) & (dataD[:, 0] == DONOR_CHANNEL), 1]  # channel
-microA = dataA[(BRD_ACC[0] < dataA[:, 1]) & (dataA[:, 1] < BRD_ACC[1]) & (dataA[:, 0] == ACCEPTOR_CHANNEL), 1]  # channel
+# microtime histograms of the donor and acceptor IRF (cached per file)
+histD = cached_histogram(DATA_FOLDER + '/' + DATA_FILE_DONOR + '.ptu')
+histA = cached_histogram(DATA_FOLDER + '/' + DATA_FILE_ACCEPTOR + '.ptu')
 
 # microtime bin edges
 edgesD = np.arange(BRD_FRET[0], BRD_FRET[1])
 edgesA = np.arange(BRD_ACC[0], BRD_ACC[1])
 
-# calculation of microtime histograms
-hD, _ = np.histogram(microD, bins=np.append(edgesD, edgesD[-1] + 1))
-hA, _ = np.histogram(microA, bins=np.append(edgesA, edgesA[-1] + 1))
+# microtime histograms inside of the windows, the borders of the windows are excluded
+hD = microtime_counts(histD, DONOR_CHANNEL, edgesD) * (edgesD > BRD_FRET[0])
+hA = microtime_counts(histA, ACCEPTOR_CHANNEL, edgesA) * (edgesA > BRD_ACC[0])
 
 # background substraction
 hD_bg = hD - np.mean(hD[-100:])
@@ -58,6 +54,10 @@ hA_bg = hA - np.mean(hA[-100:])
 MEAN_IRF_DONOR = (np.sum(hD_bg * edgesD) / np.sum(hD_bg)) * DT_BIN * 1e-3  # (ns)
 MEAN_IRF_ACCEPTOR = (np.sum(hA_bg * edgesA) / np.sum(hA_bg)) * DT_BIN * 1e-3  # (ns)
 
+# save IRF histograms for the burst-wise lifetime fits in S2
+irf_path = os.path.join("settings", f"IRF_{SETTINGS_FILE[9:]}.npz")
+np.savez(irf_path, IRF_Donor=hD_bg, IRF_Acceptor=hA_bg, Edges_Donor=edgesD, Edges_Acceptor=edgesA)
+
 # Histogram plotting
 f1, (ax1, ax2) = plt.subplots(2, 1, figsize=(6, 4))
 
@@ -0,0 +1,102 @@
+import os
+import numpy as np
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+import pandas as pd
+from scripts.Photon_Streams import stream_lut
+from scripts.Sweep_Functions import sweep_file, sweep_summary
+from alive_progress import alive_bar
+import json
+
+# PARAMETER
+#########################################################################
+DATA_FOLDER = "20250926_hpT5_100mM_NaCl_PTU"
+
+SETTINGS_FILE = "Settings_20251001_214343"
+
+BASE_T = 0.1 # (ms) finest bin time, all BIN_TS have to be multiples of BASE_T
+BIN_TS = [0.5, 1, 2, 5] # (ms) bin times of the sweep
+THRESHOLDS = np.arange(10, 201, 10) # (kHz) intensity thresholds of the sweep
+ALGORITHMS = [0, 1, 2, 3, 4] # threshold filters of the sweep, see ALGORITHM in S2
+#########################################################################
+
+mpl.use('TkAgg') # uses external plotting
+
+# Load settings
+with open(os.path.join("settings", f"{SETTINGS_FILE}.json"), 'r') as f:
+    settings = json.load(f)
+
+BRD_FRET = settings['FRET'] # microtime borders for FRET
+BRD_ACC = settings['Acceptor'] # microtime borders for acceptor check
+DONOR_CHANNEL = settings['Donor_channel'] # channel of the donor signal
+ACCEPTOR_CHANNEL = settings['Acceptor_channel'] # channel of the acceptor signal
+
+lut = stream_lut(BRD_FRET, BRD_ACC, DONOR_CHANNEL, ACCEPTOR_CHANNEL) # (channel, microtime) -> photon stream
+
+for BIN_T in BIN_TS:
+    if abs(BIN_T / BASE_T - round(BIN_T / BASE_T)) > 1e-9:
+        print(f'BIN_T = {BIN_T} ms is not a multiple of BASE_T = {BASE_T} ms!')
+        exit(0)
+
+# Load measurement folder
+FOLDER = os.path.basename(DATA_FOLDER)
+
+contPath = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.ptu')]
+
+numF = len(contPath)
+
+print(' ')
+print('=====================================================')
+print('Parameter sweep running...')
+
+# every file is read and binned once, the statistics of all grid points are summed over the files
+sums = 0
+
+with alive_bar(numF, force_tty=True) as bar:
+
+    for iterF in range(numF):
+
+        sums = sums + sweep_file(DATA_FOLDER + '/' + contPath[iterF], lut, BASE_T, BIN_TS, ALGORITHMS, THRESHOLDS)
+
+        bar()
+
+print('...Parameter sweep done!')
+print('=====================================================')
+
+df = pd.DataFrame(sweep_summary(sums, BIN_TS, ALGORITHMS, THRESHOLDS))
+
+# save sweep table
+if not os.path.exists("results"):
+    os.makedirs("results")
+
+sweep_path = os.path.join("results", f"Sweep_{FOLDER}.csv")
+
+df.to_csv(sweep_path, index=False)
+
+print(f'Sweep table saved in {sweep_path}!')
+
+# number of bursts and uncorrected E and S for every algorithm
+fig, axs = plt.subplots(3, len(ALGORITHMS), figsize=(3 * len(ALGORITHMS), 7), squeeze=False)
+
+for iterA, ALGORITHM in enumerate(ALGORITHMS):
+
+    for BIN_T in BIN_TS:
+
+        sel = df[(df['ALGORITHM'] == ALGORITHM) & (df['BIN_T'] == BIN_T)]
+
+        axs[0, iterA].semilogy(sel['THRE_B'], sel['Bursts'], label=f'{BIN_T} ms')
+        axs[1, iterA].errorbar(sel['THRE_B'], sel['E_mean'], yerr=sel['E_std'], capsize=2)
+        axs[2, iterA].errorbar(sel['THRE_B'], sel['S_mean'], yerr=sel['S_std'], capsize=2)
+
+    axs[0, iterA].set_title(f'ALGORITHM {ALGORITHM}')
+    axs[1, iterA].set_ylim(-0.1, 1.1)
+    axs[2, iterA].set_ylim(-0.1, 1.1)
+    axs[2, iterA].set_xlabel('THRE_B (kHz)')
+
+axs[0, 0].set_ylabel('number of bursts')
+axs[1, 0].set_ylabel('E_PR')
+axs[2, 0].set_ylabel('S')
+axs[0, 0].legend()
+
+plt.tight_layout()
+plt.show()
@@ -0,0 +1,87 @@
+import os
+import matplotlib as mpl
+import pandas as pd
+from scripts.Photon_Streams import stream_lut
+from scripts.Correlation_Functions import CORRELATIONS, correlate_file, correlation_summary
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import json
+
+# PARAMETER
+#########################################################################
+DATA_FOLDER = "20250926_hpT5_100mM_NaCl_PTU"
+
+SETTINGS_FILE = "Settings_20251001_214343"
+
+MAX_TAU = 1 # (s) maximal lag time of the correlation curves
+NUM_WORKERS = 4 # number of parallel worker processes (one file per worker)
+#########################################################################
+
+mpl.use('TkAgg') # uses external plotting
+import matplotlib.pyplot as plt # after the backend selection
+
+# Load settings
+with open(os.path.join("settings", f"{SETTINGS_FILE}.json"), 'r') as f:
+    settings = json.load(f)
+
+BRD_FRET = settings['FRET'] # microtime borders for FRET
+BRD_ACC = settings['Acceptor'] # microtime borders for acceptor check
+DONOR_CHANNEL = settings['Donor_channel'] # channel of the donor signal
+ACCEPTOR_CHANNEL = settings['Acceptor_channel'] # channel of the acceptor signal
+
+lut = stream_lut(BRD_FRET, BRD_ACC, DONOR_CHANNEL, ACCEPTOR_CHANNEL) # (channel, microtime) -> photon stream
+
+# Load measurement folder
+FOLDER = os.path.basename(DATA_FOLDER)
+
+contPath = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.ptu')]
+
+if __name__ == '__main__': # worker processes import this file without running the correlation
+
+    print(' ')
+    print('=====================================================')
+    print('Correlation running...')
+
+    filePaths = [DATA_FOLDER + '/' + fname for fname in contPath]
+
+    # correlation curves of every file, combined to mean and standard error over the files
+    with ProcessPoolExecutor(NUM_WORKERS) as pool:
+        results = list(pool.map(correlate_file, filePaths, repeat(lut), repeat(MAX_TAU)))
+
+    lags = results[0][0] # (s)
+    summary = correlation_summary(results)
+
+    print('...Correlation done!')
+    print('=====================================================')
+
+    df = pd.DataFrame({'tau (s)': lags, **summary})
+
+    # save correlation table
+    if not os.path.exists("results"):
+        os.makedirs("results")
+
+    corr_path = os.path.join("results", f"Correlation_{FOLDER}.csv")
+
+    df.to_csv(corr_path, index=False)
+
+    print(f'Correlation table saved in {corr_path}!')
+
+    # mean curves of all files with standard error
+    fig, axs = plt.subplots(1, 2, figsize=(10, 4))
+
+    for name, ax, color in [('DD', axs[0], (0, 0.75, 0)), ('AA', axs[0], (0.75, 0, 0)),
+                            ('DA', axs[1], (0.75, 0.75, 0)), ('PIE', axs[1], (0.75, 0, 0.75))]:
+
+        ax.semilogx(lags, summary[name], color=color, label=f'{name} ({CORRELATIONS[name][0]} x {CORRELATIONS[name][1]})')
+        ax.fill_between(lags, summary[name] - summary[f'{name}_sem'], summary[name] + summary[f'{name}_sem'], color=color, alpha=0.3, linewidth=0)
+
+    for ax in axs:
+        ax.set_xlabel(r'$\tau$ (s)')
+        ax.set_ylabel(r'$G(\tau)$')
+        ax.legend()
+
+    axs[0].set_title('autocorrelation')
+    axs[1].set_title('cross-correlation')
+
+    plt.tight_layout()
+    plt.show()
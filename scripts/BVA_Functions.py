@@ -0,0 +1,83 @@
+import numpy as np
+from scipy.stats import chi2
+
+BVA_CONFIDENCE = 0.999 # confidence level of the upper shot-noise bound of the E bins
+
+def bva_bursts(isAcc, lo, hi, n):
+
+    # Burst variance analysis of all bursts without a loop over the bursts: the donor excitation photons [lo, hi) of
+    # every burst are split into consecutive windows of n photons (an incomplete last window is dropped) and the
+    # proximity ratio of every window is its fraction of acceptor photons. All windows are reduced per burst with
+    # np.bincount. isAcc ... acceptor photon flags of the donor excitation stream (DD + DA, time order)
+    # Returns the number of windows, the mean and the standard deviation (NaN for less than 2 windows) of the
+    # window proximity ratios of every burst.
+    numW = (hi - lo) // n
+    offsets = np.concatenate([[0], np.cumsum(numW)])
+
+    # first photon of every window and burst of every window
+    burst = np.repeat(np.arange(len(numW)), numW)
+    start = np.repeat(lo, numW) + (np.arange(offsets[-1]) - offsets[:-1][burst]) * n
+
+    cs = np.concatenate([[0], np.cumsum(isAcc, dtype=np.int64)])
+    E_w = (cs[start + n] - cs[start]) / n
+
+    sumE = np.bincount(burst, weights=E_w, minlength=len(numW))
+    meanE = np.divide(sumE, numW, out=np.full(len(numW), np.nan), where=numW > 0)
+
+    sumSq = np.bincount(burst, weights=(E_w - meanE[burst]) ** 2, minlength=len(numW))
+    sigmaE = np.sqrt(np.divide(sumSq, numW - 1, out=np.full(len(numW), np.nan), where=numW > 1))
+
+    return numW, meanE, sigmaE
+
+def shot_noise(E, n):
+
+    # standard deviation of the proximity ratio of n photon windows from binomial shot noise only
+    E = np.clip(E, 0, 1)
+    return np.sqrt(E * (1 - E) / n)
+
+def shot_noise_bound(E, n, numW, confidence=BVA_CONFIDENCE):
+
+    # upper bound of the standard deviation of numW shot-noise limited windows at the confidence level (chi-square
+    # distribution of the sample variance), NaN for less than 2 windows
+    numW = np.asarray(numW, dtype=float)
+    scale = np.sqrt(np.divide(chi2.ppf(confidence, np.maximum(numW - 1, 1)), numW - 1, out=np.full(numW.shape, np.nan), where=numW > 1))
+
+    return shot_noise(E, n) * scale
+
+def bva_summary(numW, meanE, sigmaE, edges, n):
+
+    # E-binned BVA: the windows of all bursts with their mean proximity ratio inside of a bin are pooled, the standard
+    # deviation of the pooled windows is rebuilt from the per burst sums (no window data needed). The shot-noise
+    # limit and its upper bound at the mean proximity ratio of every bin are added for the comparison.
+    numW = np.asarray(numW, dtype=float)
+    meanE = np.asarray(meanE, dtype=float)
+
+    valid = (numW > 0) & ~np.isnan(meanE)
+    binE = np.minimum(np.digitize(meanE[valid], edges) - 1, len(edges) - 2) # last bin closed (E = 1 is common)
+    inside = (binE >= 0) & (binE < len(edges) - 1)
+
+    binE = binE[inside]
+    w = numW[valid][inside]
+    m = meanE[valid][inside]
+    s = np.nan_to_num(np.asarray(sigmaE, dtype=float)[valid][inside])
+
+    numBins = len(edges) - 1
+    N = np.bincount(binE, weights=w, minlength=numBins)
+    S1 = np.bincount(binE, weights=w * m, minlength=numBins)
+    S2 = np.bincount(binE, weights=(w - 1) * s ** 2 + w * m ** 2, minlength=numBins)
+
+    mean = np.divide(S1, N, out=np.full(numBins, np.nan), where=N > 0)
+    var = np.divide(S2 - N * mean ** 2, N - 1, out=np.full(numBins, np.nan), where=N > 1)
+
+    centres = (edges[:-1] + edges[1:]) / 2
+    E = np.where(N > 0, mean, centres)
+
+    return {
+        'E': centres,
+        'E_mean': mean,
+        'sigma': np.sqrt(np.clip(var, 0, None)),
+        'windows': N,
+        'bursts': np.bincount(binE, minlength=numBins),
+        'shot_noise': shot_noise(E, n),
+        'upper_bound': shot_noise_bound(E, n, N),
+    }
@@ -0,0 +1,80 @@
+import numpy as np
+from scripts.Read_PTU import read_photons
+from scripts.Photon_Streams import sync_counts, bin_trace, partition_photons
+
+BG_SIGMA = 3 # bins above mean + BG_SIGMA * sqrt(mean) (Poisson) of the background are burst bins
+BG_ITERATIONS = 10 # maximal number of iterations of the burst exclusion
+
+def background_bins(I_All):
+
+    # Burst-excluded bins of a total intensity trace: bins above the Poisson threshold of the background and their
+    # neighbours are excluded, the background level is iterated until the selection does not change any more.
+    isBG = np.ones(len(I_All), dtype=bool)
+
+    for _ in range(BG_ITERATIONS):
+
+        level = np.mean(I_All[isBG])
+        isBurst = I_All > level + BG_SIGMA * np.sqrt(max(level, 1))
+
+        # neighbouring bins contain the rising and falling edges of the bursts
+        isBurst[1:] |= isBurst[:-1].copy()
+        isBurst[:-1] |= isBurst[1:].copy()
+
+        if np.array_equal(~isBurst, isBG) or isBurst.all():
+            break
+
+        isBG = ~isBurst
+
+    return isBG
+
+def background_file(fileIN, lut, BIN_T, SEG_T):
+
+    # Background intensities BD, BA and BA0 (kHz) of one file from its burst-excluded bins of BIN_T (ms), for the
+    # whole file and for segments of SEG_T (s). The background time (s) of each value is returned as weight.
+    photons, unit, globRes, binRes = read_photons(fileIN)
+
+    streams = partition_photons(photons, lut)
+    nsync = photons['nsync']
+
+    BIN_S = sync_counts(BIN_T, globRes) # (sync) bin time
+    numBins = int(nsync[streams['All']][-1] // BIN_S) + 1
+
+    I_D = bin_trace(nsync[streams['D']], BIN_S, 0, numBins)
+    I_A = bin_trace(nsync[streams['A']], BIN_S, 0, numBins)
+    I_A0 = bin_trace(nsync[streams['A0']], BIN_S, 0, numBins)
+
+    isBG = background_bins(I_D + I_A + I_A0)
+
+    binT = BIN_S * globRes * 1e3 # (ms) exact bin time
+
+    # segment of every bin, all sums per segment at once
+    seg = (np.arange(numBins) * binT * 1e-3 // SEG_T).astype(np.intp)
+    numBG = np.bincount(seg[isBG], minlength=seg[-1] + 1)
+
+    result = {'T': np.sum(isBG) * binT * 1e-3, 'T_seg': numBG * binT * 1e-3} # (s)
+
+    for key, I in [('BD', I_D), ('BA', I_A), ('BA0', I_A0)]:
+        result[key] = np.sum(I[isBG]) / max(np.sum(isBG), 1) / binT # (kHz)
+        result[f'{key}_seg'] = np.divide(np.bincount(seg[isBG], weights=I[isBG], minlength=len(numBG)), numBG * binT,
+                                         out=np.full(len(numBG), np.nan), where=numBG > 0) # (kHz)
+
+    return result
+
+def background_summary(results):
+
+    # background of all files: mean over the files weighted by their background time and standard deviation of the
+    # segments weighted by their background time (same keys as the interactive background selection in S1)
+    T = np.array([r['T'] for r in results])
+    T_seg = np.concatenate([r['T_seg'] for r in results])
+
+    summary = {}
+    for key in ['BD', 'BA', 'BA0']:
+
+        mean = np.average([r[key] for r in results], weights=T)
+        seg = np.concatenate([r[f'{key}_seg'] for r in results])
+        valid = T_seg > 0
+
+        summary[f'{key}_mean'] = mean
+        summary[f'{key}_std'] = np.sqrt(np.average((seg[valid] - mean) ** 2, weights=T_seg[valid]))
+
+    return summary
@@ -0,0 +1,295 @@
+import numpy as np
+from scripts.Read_PTU import read_photons
+from scripts.Photon_Streams import sync_counts, bin_trace, stream_lut, partition_photons
+from scripts.To_CDE_Functions import FRET_2CDE_batch, ALEX_2CDE_batch
+from scripts.Lifetime_MLE import mle_lifetimes
+from scripts.BVA_Functions import bva_bursts
+
+def burst_ranges(macro, startB, stopB):
+
+    # photon index ranges [lo, hi) of the bursts [startB, stopB) in sorted integer macrotimes (sync)
+    lo = np.searchsorted(macro, startB, side='left')
+    hi = np.searchsorted(macro, stopB, side='left')
+
+    return lo, hi
+
+def segment_sums(values, lo, hi):
+
+    # sums of values[lo:hi] for all segments from one cumulative sum. Unsigned integers wrap around in the
+    # cumulative sum, but the differences stay exact as long as each segment sum fits into the data type.
+    if values.dtype.kind == 'u':
+        cs = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(values, dtype=np.uint64)])
+    else:
+        cs = np.concatenate([[0], np.cumsum(values)])
+
+    return cs[hi] - cs[lo]
+
+def mean_offset(macro, lo, hi, startB):
+
+    # mean macrotime of every burst relative to its start (sync), NaN for bursts without photons
+    num = hi - lo
+    sumRel = (segment_sums(macro, lo, hi) - num.astype(np.uint64) * startB).astype(float)
+
+    return np.divide(sumRel, num, out=np.full(len(num), np.nan), where=num > 0)
+
+def burst_parameters(macro, micro, startB, stopB, globRes, DT_BIN, MEAN_IRF_DONOR, MEAN_IRF_ACCEPTOR):
+
+    # Burst parameters of all bursts [startB, stopB) (sync) of one file without a loop over the bursts.
+    # macro ... dict of sorted macrotimes (sync) of the photon streams 'All', 'D', 'A', 'A0' and 'DA'
+    # micro ... dict of the microtime channels of the streams 'D' and 'A0'
+    # Returns the parameters and the photon index ranges of every stream.
+
+    ranges = {key: burst_ranges(macro[key], startB, stopB) for key in macro}
+
+    num = {key: hi - lo for key, (lo, hi) in ranges.items()}
+
+    params = {
+        'ID': num['D'],
+        'IA': num['A'],
+        'IA0': num['A0'],
+    }
+
+    # fluorescence lifetime calculation - mean microtime minus mean IRF delay
+    sumD = segment_sums(micro['D'].astype(np.int64), *ranges['D'])
+    sumA0 = segment_sums(micro['A0'].astype(np.int64), *ranges['A0'])
+
+    params['TauD'] = np.divide(sumD, num['D'], out=np.full(len(startB), np.nan), where=num['D'] > 0) * DT_BIN * 1e-3 - MEAN_IRF_DONOR # (ns)
+    params['TauA0'] = np.divide(sumA0, num['A0'], out=np.full(len(startB), np.nan), where=num['A0'] > 0) * DT_BIN * 1e-3 - MEAN_IRF_ACCEPTOR # (ns)
+
+    # difference of the mean macrotimes after donor and acceptor excitation
+    TGR_ = mean_offset(macro['DA'], *ranges['DA'], startB)
+    TR0_ = mean_offset(macro['A0'], *ranges['A0'], startB)
+
+    DTGR_TR0 = (TGR_ - TR0_) * globRes * 1e3 # (ms)
+    DTGR_TR0[num['DA'] == 0] = 9.9
+    DTGR_TR0[num['A0'] == 0] = -9.9
+
+    params['DTGR_TR0'] = DTGR_TR0
+
+    # burst position inside the file
+    params['PosT'] = (startB + mean_offset(macro['All'], *ranges['All'], startB)) * globRes # (s)
+
+    return params, ranges
+
+def burst_photons(macro, lo, hi, startB):
+
+    # photon macrotimes of all bursts concatenated in CSR layout: times relative to the burst starts (sync)
+    # and the offsets of the bursts (length number of bursts + 1)
+    num = hi - lo
+    offsets = np.concatenate([[0], np.cumsum(num)])
+
+    idx = np.arange(offsets[-1]) + np.repeat(lo - offsets[:-1], num)
+
+    return macro[idx] - np.repeat(startB, num), offsets
+
+def burst_bins(I_D, I_A, I_A0, THRE_B, ALGORITHM):
+
+    # bin selection of the threshold filter, see ALGORITHM in S2
+    I_All = I_D + I_A + I_A0 # (kHz) total intensity
+
+    if ALGORITHM == 0:
+
+        idx = I_All >= THRE_B
+
+    elif ALGORITHM == 1:
+
+        idx = ((I_D + I_A) >= THRE_B) & (I_A0  >= THRE_B)
+
+    elif ALGORITHM == 2:
+
+        idx = I_A0  >= THRE_B
+
+    elif ALGORITHM == 3:
+
+        idx = (I_D + I_A)  >= THRE_B
+
+    elif ALGORITHM == 4:
+
+        idx = I_D  >= THRE_B
+
+    return np.where(idx == 1)[0] # burst positions
+
+def sliding_window_bursts(macro, M, T, L):
+
+    # All-photon sliding window burst search on sorted macrotimes: the M photons starting at photon i form a burst
+    # window if t[i+M-1] - t[i] <= T (same unit as macro). Every photon inside of a burst window is a burst photon and
+    # consecutive burst photons form one burst, bursts with less than L photons are rejected.
+    # Returns the photon indices [start, stop) of the bursts.
+    numPh = len(macro)
+
+    if numPh < M:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    isWin = (macro[M - 1:] - macro[:numPh - M + 1]) <= T
+
+    # photon j is covered by any of the windows j-M+1 ... j, the window counts are padded at both ends
+    cs = np.cumsum(isWin)
+    hi = np.concatenate([cs, np.full(M - 1, cs[-1])])
+    lo = np.concatenate([np.zeros(M, dtype=cs.dtype), cs[:numPh - M]])
+    isBurst = hi > lo
+
+    # run-length detection of the burst photons
+    edges = np.diff(np.concatenate([[0], isBurst.astype(np.int8), [0]]))
+    start = np.flatnonzero(edges == 1)
+    stop = np.flatnonzero(edges == -1)
+
+    keep = (stop - start) >= L
+
+    return start[keep], stop[keep]
+
+def intersect_intervals(startA, stopA, startB, stopB):
+
+    # intersection of two sets of sorted, non-overlapping intervals [start, stop) by an event sweep:
+    # starts count +1, stops -1 and the intersections are the parts covered by both sets (level 2)
+    times = np.concatenate([startA, startB, stopA, stopB])
+    steps = np.concatenate([np.ones(len(startA) + len(startB), dtype=np.int8), -np.ones(len(stopA) + len(stopB), dtype=np.int8)])
+
+    order = np.lexsort((steps, times)) # stops before starts at equal times -> touching intervals do not intersect
+    level = np.cumsum(steps[order])
+
+    pos = np.flatnonzero(level == 2) # the event after level 2 is always a stop
+    start = times[order[pos]]
+    stop = times[order[pos + 1]]
+
+    keep = stop > start
+
+    return start[keep], stop[keep]
+
+def dual_channel_bursts(macroDex, macroAex, macroAll, M, T, L):
+
+    # Dual-channel burst search: sliding window burst searches (M, T) on the photons after donor excitation and
+    # after acceptor excitation, bursts are the times where both streams are in a burst. Bursts with less than L
+    # photons of all streams are rejected, the bursts span from their first to their last photon (sync).
+    burstT = []
+    for macro in [macroDex, macroAex]:
+        start, stop = sliding_window_bursts(macro, M, T, 1)
+        burstT.append((macro[start], macro[stop - 1] + np.uint64(1)))
+
+    start, stop = intersect_intervals(*burstT[0], *burstT[1])
+
+    lo, hi = burst_ranges(macroAll, start, stop)
+    keep = (hi - lo) >= L
+
+    lo = lo[keep]
+    hi = hi[keep]
+
+    return macroAll[lo], macroAll[hi - 1] + np.uint64(1)
+
+def analyse_file(fileIN, config):
+
+    # Burst analysis of one PTU file. config holds the S2 parameters and the settings of S0 (see S2).
+    # Returns the burst columns with the burst positions inside the file and the length of the file (s).
+    # Burst numbers and positions across the folder are assigned by the caller in file order.
+    lut = stream_lut(config['FRET'], config['Acceptor'], config['Donor_channel'], config['Acceptor_channel'])
+
+    photons, unit, globRes, binRes = read_photons(fileIN)
+
+    SYNC_MS = globRes * 1e3 # (ms) duration of one sync period
+    BIN_S = sync_counts(config['BIN_T'], globRes) # (sync) bin time
+
+    # every photon is classified once into its photon stream
+    streams = partition_photons(photons, lut)
+
+    nsync = photons['nsync']
+    dtime = photons['dtime']
+
+    # photon arrival times -> macrotimes
+    macroAll = nsync[streams['All']] # (sync)
+    macroD = nsync[streams['D']] # (sync)
+    macroA = nsync[streams['A']]  # (sync)
+    macroA0 = nsync[streams['A0']]  # (sync)
+
+    macroDA = nsync[streams['DA']]  # (sync)
+
+    # photon delay times -> microtimes
+    microD = dtime[streams['D']]  # (channel)
+    microA0 = dtime[streams['A0']]  # (channel)
+
+    lenT = int(macroAll[-1] - macroAll[0]) * globRes # (s)
+
+    numBins = int(macroAll[-1] // BIN_S) + 1 # bins start at macrotime zero
+
+    if config['ALGORITHM'] == 5:
+
+        # sliding window burst search on all photons -> bursts from the first to the last burst photon (sync)
+        start, stop = sliding_window_bursts(macroAll, config['APBS_M'], sync_counts(config['APBS_T'], globRes), config['APBS_L'])
+
+        startB = macroAll[start]
+        stopB = macroAll[stop - 1] + np.uint64(1)
+
+        durB = (stopB - startB) * SYNC_MS # (ms) burst durations
+
+    elif config['ALGORITHM'] == 6:
+
+        # dual-channel burst search - donor excitation (DD + DA) and acceptor excitation (AA) both in a burst
+        startB, stopB = dual_channel_bursts(macroDA, macroA0, macroAll, config['APBS_M'], sync_counts(config['APBS_T'], globRes), config['APBS_L'])
+
+        durB = (stopB - startB) * SYNC_MS # (ms) burst durations
+
+    else:
+
+        # calculate histograms
+        I_D = bin_trace(macroD, BIN_S, 0, numBins)
+        I_A = bin_trace(macroA, BIN_S, 0, numBins)
+        I_A0 = bin_trace(macroA0, BIN_S, 0, numBins)
+
+        posB = burst_bins(I_D, I_A, I_A0, config['THRE_B'], config['ALGORITHM'])
+
+        # burst bins (sync)
+        startB = posB.astype(np.uint64) * np.uint64(BIN_S)
+        stopB = startB + np.uint64(BIN_S)
+
+        durB = np.full(len(posB), config['BIN_T'], dtype=float) # (ms)
+
+    # all burst parameters from the photon index ranges of the bursts
+    macro = {'All': macroAll, 'D': macroD, 'A': macroA, 'A0': macroA0, 'DA': macroDA}
+    micro = {'D': microD, 'A0': microA0}
+
+    params, ranges = burst_parameters(macro, micro, startB, stopB, globRes, config['dt'], config['MEAN_IRF_DONOR'], config['MEAN_IRF_ACCEPTOR'])
+
+    if config['TAU_METHOD'] == 1:
+
+        # burst-wise maximum likelihood lifetimes with the IRF convolved decay models of the microtime windows
+        for key, firstCh, modelPath in [('D', config['FRET'][0], config['MODELS_D']), ('A0', config['Acceptor'][0], config['MODELS_A0'])]:
+            with np.load(modelPath) as models:
+                params[f'Tau{key}'] = mle_lifetimes(micro[key], *ranges[key], firstCh, models['logModels'], models['tauGrid']) # (ns)
+
+    # photon density indicators of all bursts - burst photons in CSR layout, times relative to the bin start (ms)
+    tA, offA = burst_photons(macroA, *ranges['A'], startB)
+    tD, offD = burst_photons(macroD, *ranges['D'], startB)
+    tA0, offA0 = burst_photons(macroA0, *ranges['A0'], startB)
+    tDA, offDA = burst_photons(macroDA, *ranges['DA'], startB)
+
+    params['FRET2CDE'] = FRET_2CDE_batch(tA * SYNC_MS, offA, tD * SYNC_MS, offD, 0.045) # kernel size is taken from the paper
+    params['ALEX2CDE'] = ALEX_2CDE_batch(tA0 * SYNC_MS, offA0, tDA * SYNC_MS, offDA, 0.075) # kernel size is taken from the paper
+
+    # burst variance analysis - windows of BVA_N donor excitation photons, acceptor photons of the DD + DA stream
+    isAccDA = photons['channel'][streams['DA']] == config['Acceptor_channel']
+    params['BVA_W'], params['BVA_E'], params['BVA_SIGMA'] = bva_bursts(isAccDA, *ranges['DA'], config['BVA_N'])
+
+    params['BIN_T'] = durB # (ms) bin time or burst duration, used for the background correction in S3
+
+    return params, lenT
+
+def limit_memory(maxGB):
+
+    # initializer of the worker processes: caps the memory of each worker at maxGB (GB), 0 -> no limit.
+    # A worker that exceeds the limit fails with a MemoryError instead of swapping the whole machine.
+    if maxGB <= 0:
+        return
+
+    try:
+        import resource
+    except ImportError: # not available on Windows
+        print('WARNING: memory limit of the workers is not supported on this system!')
+        return
+
+    maxBytes = int(maxGB * 1e9)
+    limit = resource.RLIMIT_DATA if hasattr(resource, 'RLIMIT_DATA') else resource.RLIMIT_AS
+
+    hard = resource.getrlimit(limit)[1]
+
+    if hard != resource.RLIM_INFINITY:
+        maxBytes = min(maxBytes, hard)
+
+    resource.setrlimit(limit, (maxBytes, hard))
@@ -0,0 +1,129 @@
+import numpy as np
+from scripts.Read_PTU import read_photons
+from scripts.Photon_Streams import partition_photons
+
+LAGS_PER_LEVEL = 16 # lags of the first level, every further level adds LAGS_PER_LEVEL / 2 lags of twice the spacing
+PHOTON_BLOCK = 2**20 # photons of A paired at once (up to LAGS_PER_LEVEL pairs per photon and level)
+
+# correlations of the photon streams of partition_photons: name -> (stream at t, stream at t + tau)
+CORRELATIONS = {
+    'DD': ('D', 'D'), # donor autocorrelation
+    'AA': ('A0', 'A0'), # acceptor autocorrelation after acceptor excitation (PIE)
+    'DA': ('D', 'A'), # cross-correlation of donor and FRET-sensitized acceptor
+    'PIE': ('D', 'A0'), # cross-correlation of donor and directly excited acceptor (PIE-FCCS)
+}
+
+def multitau_lags(maxLag, lagsPerLevel=LAGS_PER_LEVEL):
+
+    # Multi-tau lags (sync) up to maxLag: level 0 has the lags 1 ... lagsPerLevel - 1, level l > 0 the lags
+    # lagsPerLevel / 2 ... lagsPerLevel - 1 in units of 2**l sync. Returns a list of (level, lags in level units).
+    levels = [(0, np.arange(1, lagsPerLevel))]
+
+    while levels[-1][1][-1] * 2**levels[-1][0] < maxLag:
+        level = levels[-1][0] + 1
+        levels.append((level, np.arange(lagsPerLevel // 2, lagsPerLevel)))
+
+    return levels
+
+def coarsen_timestamps(t, w):
+
+    # timestamps of the next level (half resolution), photons in the same coarse bin are merged into one weight
+    t = t >> np.uint64(1)
+
+    if len(t) == 0:
+        return t, w
+
+    first = np.flatnonzero(np.concatenate([[True], t[1:] != t[:-1]]))
+
+    return t[first], np.add.reduceat(w, first)
+
+def correlate(tA, tB, T, maxLag, lagsPerLevel=LAGS_PER_LEVEL):
+
+    # Photon-by-photon multi-tau correlation G(tau) = <dI_A(t) dI_B(t + tau)> / (<I_A> <I_B>) of two sorted
+    # integer timestamp arrays (sync) of a measurement of T sync. On every level the photons of B inside of the lag
+    # range of every photon of A are found with two searchsorted and the weighted pairs are counted per lag with
+    # np.bincount, then both streams are coarsened by a factor of 2 with merged weights - no dense time grid is
+    # used. Returns the lags (sync) and G.
+    levels = multitau_lags(maxLag, lagsPerLevel)
+    lags = np.concatenate([ks * 2**level for level, ks in levels])
+
+    if len(tA) == 0 or len(tB) == 0:
+        return lags, np.full(len(lags), np.nan)
+
+    isAuto = tA is tB
+    wA = np.ones(len(tA))
+    wB = wA if isAuto else np.ones(len(tB))
+
+    G = []
+    coarseLevel = 0
+
+    for level, ks in levels:
+
+        while coarseLevel < level:
+            tA, wA = coarsen_timestamps(tA, wA)
+            tB, wB = (tA, wA) if isAuto else coarsen_timestamps(tB, wB)
+            coarseLevel += 1
+
+        T_l = -(-T // 2**level) # number of bins of the level
+
+        # cumulative weights for the number of photons inside of the overlap of both traces
+        cumA = np.concatenate([[0], np.cumsum(wA)])
+        cumB = np.concatenate([[0], np.cumsum(wB)])
+
+        S = np.zeros(len(ks))
+
+        for start in range(0, len(tA), PHOTON_BLOCK):
+
+            t = tA[start:start + PHOTON_BLOCK]
+
+            # pairs of every photon of A with the photons of B at t + ks[0] ... t + ks[-1]
+            lo = np.searchsorted(tB, t + np.uint64(ks[0]))
+            num = np.searchsorted(tB, t + np.uint64(ks[-1] + 1)) - lo
+
+            iA = np.repeat(np.arange(len(t)), num)
+            iB = np.arange(len(iA)) + np.repeat(lo - np.concatenate([[0], np.cumsum(num)[:-1]]), num)
+
+            S += np.bincount((tB[iB] - t[iA]).astype(np.intp) - ks[0], weights=wA[start + iA] * wB[iB], minlength=len(ks))
+
+        for k, S_k in zip(ks, S):
+
+            NA = cumA[np.searchsorted(tA, np.uint64(max(T_l - k, 0)))] # photons of A at t < T - k
+            NB = cumB[-1] - cumB[np.searchsorted(tB, np.uint64(k))] # photons of B at t >= k
+
+            G.append(S_k * (T_l - k) / (NA * NB) - 1 if NA * NB > 0 else np.nan)
+
+    return lags, np.array(G)
+
+def correlate_file(fileIN, lut, maxTau, lagsPerLevel=LAGS_PER_LEVEL):
+
+    # all CORRELATIONS of one file up to the lag time maxTau (s), returns the lags (s) and a dict name -> G
+    photons, unit, globRes, binRes = read_photons(fileIN)
+
+    streams = partition_photons(photons, lut)
+    nsync = photons['nsync']
+
+    T = int(nsync[-1]) + 1 if len(nsync) else 1 # (sync) measurement time
+    maxLag = int(round(maxTau / globRes))
+
+    macro = {key: nsync[streams[key]] for key in ['D', 'A', 'A0']}
+
+    curves = {}
+    for name, (keyA, keyB) in CORRELATIONS.items():
+        lags, curves[name] = correlate(macro[keyA], macro[keyB], T, maxLag, lagsPerLevel)
+
+    return lags * globRes, curves
+
+def correlation_summary(results):
+
+    # mean and standard error of the mean of the curves of all files (results of correlate_file)
+    summary = {}
+
+    for name in CORRELATIONS:
+
+        curves = np.array([r[1][name] for r in results])
+        num = np.sum(~np.isnan(curves), axis=0)
+
+        summary[name] = np.nanmean(curves, axis=0)
+        summary[f'{name}_sem'] = np.nanstd(curves, axis=0, ddof=1) / np.sqrt(num) if len(results) > 1 else np.full(curves.shape[1], np.nan)
+
+    return summary
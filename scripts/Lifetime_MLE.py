@@ -0,0 +1,85 @@
+import numpy as np
+import os
+import hashlib
+from scipy.sparse import csr_matrix
+
+MODEL_CACHE = "cache"
+TAU_GRID = np.geomspace(0.05, 12, 256) # (ns) lifetime grid of the models
+BG_FRACTION = 0.02 # fraction of uniform background in the models, single background photons far from the decay
+                   # would otherwise dominate the likelihood
+BURST_BLOCK = 20000 # bursts scored at once against the whole grid
+
+def decay_models(irf, DT_BIN, tauGrid=TAU_GRID, bgFraction=BG_FRACTION):
+
+    # Log-probabilities of the microtime channels of a window for every lifetime of tauGrid: mono-exponential decays
+    # convolved with the IRF histogram of the window (FFT), mixed with uniform background and normalised on the
+    # window. The first channel is the excluded border of the window.
+    # irf ... background corrected IRF counts of the window channels, DT_BIN ... (ps) microtime resolution
+    numCh = len(irf)
+    t = np.arange(numCh) * DT_BIN * 1e-3 # (ns)
+
+    decays = np.exp(-t[None, :] / tauGrid[:, None])
+
+    models = np.fft.irfft(np.fft.rfft(np.clip(irf, 0, None), 2 * numCh)[None, :] * np.fft.rfft(decays, 2 * numCh, axis=1), 2 * numCh, axis=1)[:, :numCh]
+    models = np.clip(models, 0, None)
+    models[:, 0] = 0
+
+    models = (1 - bgFraction) * models / np.sum(models, axis=1, keepdims=True) + bgFraction / (numCh - 1)
+    models[:, 0] = 1 # log(1) = 0 - the border channel never contains photons
+
+    return np.log(models)
+
+def cached_models(irf, DT_BIN, tauGrid=TAU_GRID, bgFraction=BG_FRACTION, cacheFolder=MODEL_CACHE):
+
+    # decay_models stored in cacheFolder/Lifetime_models_<key>.npz, key from the IRF, DT_BIN, the grid and the
+    # background fraction. Returns the path of the models.
+    h = hashlib.sha256()
+    for part in [np.asarray(irf, dtype=float), np.asarray(tauGrid, dtype=float), np.array([DT_BIN, bgFraction], dtype=float)]:
+        h.update(part.tobytes())
+
+    modelPath = os.path.join(cacheFolder, f"Lifetime_models_{h.hexdigest()[:16]}.npz")
+
+    if not os.path.exists(modelPath):
+
+        if not os.path.exists(cacheFolder):
+            os.makedirs(cacheFolder)
+
+        np.savez(modelPath, logModels=decay_models(irf, DT_BIN, tauGrid, bgFraction), tauGrid=tauGrid)
+
+    return modelPath
+
+def mle_lifetimes(micro, lo, hi, firstCh, logModels, tauGrid):
+
+    # Burst-wise maximum likelihood lifetimes (ns): the microtime histograms of all bursts (sparse matrix burst x
+    # channel from the photon index ranges [lo, hi)) are scored against all models with one matrix product per block
+    # of bursts. The maximum on the grid is refined by a parabola in log(tau). NaN for bursts without photons.
+    # firstCh ... microtime channel of the first model channel
+    num = hi - lo
+    offsets = np.concatenate([[0], np.cumsum(num)])
+
+    idx = np.arange(offsets[-1]) + np.repeat(lo - offsets[:-1], num)
+    ch = micro[idx].astype(np.intp) - firstCh
+
+    counts = csr_matrix((np.ones(len(ch)), ch, offsets), shape=(len(num), logModels.shape[1]))
+
+    logTau = np.log(tauGrid)
+    tau = np.full(len(num), np.nan)
+
+    for start in range(0, len(num), BURST_BLOCK):
+
+        logL = (counts[start:start + BURST_BLOCK] @ logModels.T) # (bursts, grid)
+
+        best = np.clip(np.argmax(logL, axis=1), 1, len(tauGrid) - 2)
+        rows = np.arange(len(best))
+
+        # vertex of the parabola through the neighbours of the maximum (log-spaced grid)
+        l0, l1, l2 = logL[rows, best - 1], logL[rows, best], logL[rows, best + 1]
+        curv = l0 - 2 * l1 + l2
+        shift = np.divide(l0 - l2, 2 * curv, out=np.zeros(len(best)), where=curv < 0)
+
+        step = logTau[best + 1] - logTau[best]
+        tau[start:start + len(best)] = np.exp(logTau[best] + np.clip(shift, -1, 1) * step)
+
+    tau[num == 0] = np.nan
+
+    return tau
@@ -0,0 +1,110 @@
+import numpy as np
+import os
+import pickle
+from scripts.Read_PTU import iter_photons
+from scripts.Photon_Streams import LUT_MICROTIMES
+
+HISTOGRAM_CACHE = "cache"
+
+def file_histogram(fileIN, maxT=0):
+
+    # Microtime histograms of all detection channels of one file, streamed in chunks with one np.bincount on the
+    # combined index channel * LUT_MICROTIMES + microtime per chunk. maxT (s) > 0 uses only the first maxT seconds.
+    # Returns an array hist[channel, microtime channel] trimmed to the used channels and microtimes.
+    chunks, unit, globRes, binRes = iter_photons(fileIN)
+
+    maxSync = np.uint64(round(maxT / globRes)) if maxT > 0 else None
+
+    hist = np.zeros(0, dtype=np.int64)
+
+    for photons in chunks:
+
+        channel = photons['channel']
+        dtime = photons['dtime']
+
+        if maxSync is not None and photons['nsync'][-1] >= maxSync:
+            inT = photons['nsync'] < maxSync
+            channel = channel[inT]
+            dtime = dtime[inT]
+
+        counts = np.bincount(channel.astype(np.intp) * LUT_MICROTIMES + dtime)
+
+        if len(counts) > len(hist):
+            hist = np.concatenate([hist, np.zeros(len(counts) - len(hist), dtype=np.int64)])
+
+        hist[:len(counts)] += counts
+
+        if maxSync is not None and photons['nsync'][-1] >= maxSync:
+            break
+
+    hist = np.concatenate([hist, np.zeros(-len(hist) % LUT_MICROTIMES, dtype=np.int64)]).reshape(-1, LUT_MICROTIMES)
+
+    return hist[:, :np.max(np.flatnonzero(hist.any(axis=0)), initial=0) + 1]
+
+def add_histograms(h1, h2):
+
+    # sum of two histograms of file_histogram with different numbers of channels or microtimes
+    hist = np.zeros((max(h1.shape[0], h2.shape[0]), max(h1.shape[1], h2.shape[1])), dtype=np.int64)
+    hist[:h1.shape[0], :h1.shape[1]] += h1
+    hist[:h2.shape[0], :h2.shape[1]] += h2
+
+    return hist
+
+def cached_histogram(fileIN, maxT=0, cacheFolder=HISTOGRAM_CACHE):
+
+    # file_histogram of a single file with the cache of its folder
+    return folder_histogram(os.path.dirname(fileIN) or '.', maxT, cacheFolder, [os.path.basename(fileIN)])
+
+def folder_histogram(folder, maxT=0, cacheFolder=HISTOGRAM_CACHE, files=None):
+
+    # Microtime histograms of all PTU files of a folder (or of the listed files) summed up. The histograms of the files
+    # are cached in cacheFolder/Microtimes_<folder>.pkl keyed by path, size, modification time and maxT, so added
+    # files are the only ones read again.
+    cachePath = os.path.join(cacheFolder, f"Microtimes_{os.path.basename(os.path.normpath(folder))}.pkl")
+
+    cache = {}
+    if os.path.exists(cachePath):
+        with open(cachePath, 'rb') as f:
+            cache = pickle.load(f)
+
+    if files is None:
+        files = [f for f in os.listdir(folder) if f.endswith('.ptu')]
+
+    hist = np.zeros((0, 0), dtype=np.int64)
+    isNew = False
+
+    for fname in files:
+
+        path = os.path.abspath(os.path.join(folder, fname))
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns, maxT)
+
+        if key not in cache:
+            cache[key] = file_histogram(path, maxT)
+            isNew = True
+
+        hist = add_histograms(hist, cache[key])
+
+    if isNew:
+
+        # entries of modified or deleted files are dropped
+        cache = {key: h for key, h in cache.items() if os.path.exists(key[0]) and os.stat(key[0]).st_size == key[1] and os.stat(key[0]).st_mtime_ns == key[2]}
+
+        if not os.path.exists(cacheFolder):
+            os.makedirs(cacheFolder)
+
+        with open(cachePath, 'wb') as f:
+            pickle.dump(cache, f)
+
+    return hist
+
+def microtime_counts(hist, channel, microtimes):
+
+    # counts of one detection channel at the given microtime channels, zero outside of the histogram
+    counts = np.zeros(len(microtimes), dtype=np.int64)
+
+    if channel < hist.shape[0]:
+        inside = (0 <= microtimes) & (microtimes < hist.shape[1])
+        counts[inside] = hist[channel, microtimes[inside]]
+
+    return counts
@@ -0,0 +1,80 @@
+import numpy as np
+from scripts.Read_PTU import read_photons
+
+def sync_counts(T, globRes):
+
+    # converts a time T (ms) into the nearest integer number of sync periods (globRes in s)
+    return max(int(round(T * 1e-3 / globRes)), 1)
+
+def bin_trace(macro, binSync, start=0, numBins=None):
+
+    # Time trace of integer macrotimes (sync counts): photons are assigned to bins of binSync sync periods
+    # starting at start by integer division, so the bin assignment is exact at photon boundaries
+    idx = ((macro - np.uint64(start)) // np.uint64(binSync)).astype(np.intp)
+
+    if numBins is None:
+        return np.bincount(idx)
+
+    return np.bincount(idx[idx < numBins], minlength=numBins)
+
+def base_traces(fileIN, lut, baseT):
+
+    # time traces of the streams D, A and A0 of one file at the finest bin time baseT (ms), bins start at macrotime zero
+    photons, unit, globRes, binRes = read_photons(fileIN)
+
+    streams = partition_photons(photons, lut)
+    nsync = photons['nsync']
+
+    BASE_S = sync_counts(baseT, globRes) # (sync) finest bin time
+    numBins = int(nsync[streams['All']][-1] // BASE_S) + 1
+
+    return [bin_trace(nsync[streams[key]], BASE_S, 0, numBins) for key in ['D', 'A', 'A0']]
+
+# photon stream codes
+OUT = 0 # outside of the microtime windows
+DD = 1 # donor excitation, donor emission
+DA = 2 # donor excitation, acceptor emission
+AA = 3 # acceptor excitation, acceptor emission
+XX = 4 # any other channel inside of the microtime windows, e.g. acceptor excitation, donor emission
+
+NUM_CODES = 5
+LUT_CHANNELS = 65 # photon channels are counted from 1 and have at most 6 bits
+LUT_MICROTIMES = 2**16 # microtime channels are stored as uint16
+
+def stream_lut(BRD_FRET, BRD_ACC, DONOR_CHANNEL, ACCEPTOR_CHANNEL):
+
+    # lookup table (channel, microtime) -> stream code, borders of the microtime windows are excluded
+    micro = np.arange(LUT_MICROTIMES)
+
+    inFRET = (BRD_FRET[0] < micro) & (micro < BRD_FRET[1])
+    inACC = (BRD_ACC[0] < micro) & (micro < BRD_ACC[1])
+
+    lut = np.full((LUT_CHANNELS, LUT_MICROTIMES), OUT, dtype=np.uint8)
+
+    lut[:, inFRET | inACC] = XX
+    lut[DONOR_CHANNEL, inFRET] = DD
+    lut[ACCEPTOR_CHANNEL, inFRET] = DA
+    lut[ACCEPTOR_CHANNEL, inACC] = AA
+
+    return lut
+
+def partition_photons(photons, lut):
+
+    # Classifies every photon once by the lookup table of stream_lut and returns the photon indices of each
+    # stream in time order:
+    #   'D' ... DD, 'A' ... DA, 'A0' ... AA, 'DA' ... DD and DA merged, 'All' ... all photons inside the windows
+    code = lut[photons['channel'], photons['dtime']]
+
+    # stable counting sort of the codes keeps the time order inside of every stream
+    order = np.argsort(code, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(code, minlength=NUM_CODES))])
+
+    streams = {
+        'D': order[bounds[DD]:bounds[DD + 1]],
+        'A': order[bounds[DA]:bounds[DA + 1]],
+        'A0': order[bounds[AA]:bounds[AA + 1]],
+        'DA': np.flatnonzero((code - np.uint8(DD)) <= (DA - DD)), # codes DD and DA (OUT wraps around)
+        'All': np.flatnonzero(code),
+    }
+
+    return streams
@@ -1,275 +1,533 @@
-import numpy as np
-import os
-
-def read_data(fileIN):
-
-    # Modified Read_PTU.py script to read HT3 formats of HydraHarp and TimeHarp devices
-    # This is demo code. Use at your own risk. No warranties.
-    # Keno Goertz, PicoQUant GmbH, February 2018
-    # Modified by Andreas Hartmann, B CUBE, TU Dresden, July 2025
-
-    import time
-    import struct
-    import io
-
-    # Tag Types
-    tyEmpty8 = struct.unpack(">i", bytes.fromhex("FFFF0008"))[0]
-    tyBool8 = struct.unpack(">i", bytes.fromhex("00000008"))[0]
-    tyInt8 = struct.unpack(">i", bytes.fromhex("10000008"))[0]
-    tyBitSet64 = struct.unpack(">i", bytes.fromhex("11000008"))[0]
-    tyColor8 = struct.unpack(">i", bytes.fromhex("12000008"))[0]
-    tyFloat8 = struct.unpack(">i", bytes.fromhex("20000008"))[0]
-    tyTDateTime = struct.unpack(">i", bytes.fromhex("21000008"))[0]
-    tyFloat8Array = struct.unpack(">i", bytes.fromhex("2001FFFF"))[0]
-    tyAnsiString = struct.unpack(">i", bytes.fromhex("4001FFFF"))[0]
-    tyWideString = struct.unpack(">i", bytes.fromhex("4002FFFF"))[0]
-    tyBinaryBlob = struct.unpack(">i", bytes.fromhex("FFFFFFFF"))[0]
-
-    # Record types
-    rtPicoHarp300T3 = struct.unpack(">i", bytes.fromhex('00010303'))[0]
-    rtPicoHarp300T2 = struct.unpack(">i", bytes.fromhex('00010203'))[0]
-    rtHydraHarpT3 = struct.unpack(">i", bytes.fromhex('00010304'))[0]
-    rtHydraHarpT2 = struct.unpack(">i", bytes.fromhex('00010204'))[0]
-    rtHydraHarp2T3 = struct.unpack(">i", bytes.fromhex('01010304'))[0]
-    rtHydraHarp2T2 = struct.unpack(">i", bytes.fromhex('01010204'))[0]
-    rtTimeHarp260NT3 = struct.unpack(">i", bytes.fromhex('00010305'))[0]
-    rtTimeHarp260NT2 = struct.unpack(">i", bytes.fromhex('00010205'))[0]
-    rtTimeHarp260PT3 = struct.unpack(">i", bytes.fromhex('00010306'))[0]
-    rtTimeHarp260PT2 = struct.unpack(">i", bytes.fromhex('00010206'))[0]
-    rtGenericT3 = struct.unpack(">i", bytes.fromhex('00010307'))[0]  # MultiHarpXXX and PicoHarp330
-    rtGenericT2 = struct.unpack(">i", bytes.fromhex('00010207'))[0]  # MultiHarpXXX and PicoHarp330
-
-    # global variables
-    global inputfile
-    global recNum
-    global oflcorrection
-    global truensync
-    global dlen
-    global isT2
-    global globRes
-    global numRecords
-    global unit
-
-    pathname = os.path.dirname(fileIN)
-    filename_woEXT = os.path.splitext(os.path.basename(fileIN))[0]
-
-    inputfile = open(fileIN, "rb")
-
-    # Check if inputfile is a valid PTU file
-    # Python strings don't have terminating NULL characters, so they're stripped
-    magic = inputfile.read(8).decode("utf-8").strip('\0')
-    if magic != "PQTTTR":
-        print("ERROR: Magic invalid, this is not a PTU file.")
-        inputfile.close()
-        exit(0)
-
-    version = inputfile.read(8).decode("utf-8").strip('\0')
-
-    # Write the header data to outputfile and also save it in memory.
-    # There's no do ... while in Python, so an if statement inside the while loop
-    # breaks out of it
-    tagDataList = []  # Contains tuples of (tagName, tagValue)
-    while True:
-        tagIdent = inputfile.read(32).decode("utf-8").strip('\0')
-        tagIdx = struct.unpack("<i", inputfile.read(4))[0]
-        tagTyp = struct.unpack("<i", inputfile.read(4))[0]
-        if tagIdx > -1:
-            evalName = tagIdent + '(' + str(tagIdx) + ')'
-        else:
-            evalName = tagIdent
-        if tagTyp == tyEmpty8:
-            inputfile.read(8)
-            tagDataList.append((evalName, "<empty Tag>"))
-        elif tagTyp == tyBool8:
-            tagInt = struct.unpack("<q", inputfile.read(8))[0]
-            if tagInt == 0:
-                tagDataList.append((evalName, "False"))
-            else:
-                tagDataList.append((evalName, "True"))
-        elif tagTyp == tyInt8:
-            tagInt = struct.unpack("<q", inputfile.read(8))[0]
-            tagDataList.append((evalName, tagInt))
-        elif tagTyp == tyBitSet64:
-            tagInt = struct.unpack("<q", inputfile.read(8))[0]
-            tagDataList.append((evalName, tagInt))
-        elif tagTyp == tyColor8:
-            tagInt = struct.unpack("<q", inputfile.read(8))[0]
-            tagDataList.append((evalName, tagInt))
-        elif tagTyp == tyFloat8:
-            tagFloat = struct.unpack("<d", inputfile.read(8))[0]
-            tagDataList.append((evalName, tagFloat))
-        elif tagTyp == tyFloat8Array:
-            tagInt = struct.unpack("<q", inputfile.read(8))[0]
-            tagDataList.append((evalName, tagInt))
-        elif tagTyp == tyTDateTime:
-            tagFloat = struct.unpack("<d", inputfile.read(8))[0]
-            tagTime = int((tagFloat - 25569) * 86400)
-            tagTime = time.gmtime(tagTime)
-            tagDataList.append((evalName, tagTime))
-        elif tagTyp == tyAnsiString:
-            tagInt = struct.unpack("<q", inputfile.read(8))[0]
-            tmp_bytes = inputfile.read(tagInt)
-            try:
-                tagString = tmp_bytes.decode('utf-8').strip("\0")
-            except UnicodeDecodeError:
-                tagString = tmp_bytes.decode('latin1', 'ignore').strip("\0")
-            tagDataList.append((evalName, tagString))
-        elif tagTyp == tyWideString:
-            tagInt = struct.unpack("<q", inputfile.read(8))[0]
-            tagString = inputfile.read(tagInt).decode("utf-16le", errors="ignore").strip("\0")
-            tagDataList.append((evalName, tagString))
-        elif tagTyp == tyBinaryBlob:
-            tagInt = struct.unpack("<q", inputfile.read(8))[0]
-            inputfile.seek(tagInt, 1)
-            tagDataList.append((evalName, tagInt))
-        else:
-            print("ERROR: Unknown tag type")
-            exit(0)
-        if tagIdent == "Header_End":
-            break
-
-    # Reformat the saved data for easier access
-    tagNames = [tagDataList[i][0] for i in range(0, len(tagDataList))]
-    tagValues = [tagDataList[i][1] for i in range(0, len(tagDataList))]
-
-    # get important variables from headers
-    numRecords = tagValues[tagNames.index("TTResult_NumberOfRecords")]
-    globRes = tagValues[tagNames.index("MeasDesc_GlobalResolution")]
-    binRes = tagValues[tagNames.index("MeasDesc_Resolution")]
-    print("Writing %d records, this may take a while..." % numRecords)
-
-    def readPT3():
-        global inputfile, recNum, oflcorrection, dlen, numRecords
-
-        T3WRAPAROUND = 65536
-
-        try:
-            T3Record = np.fromfile(inputfile, dtype=np.uint32, count=numRecords)
-        except:
-            print("Problems reading the file format.")
-            exit(0)
-
-        # Assume T3Record is a 32-bit unsigned integer
-        nsync = T3Record & 0xFFFF  # bitand of T3Record with 65535
-        channel = (T3Record >> 28) & 0xF  # bitshift of T3Record to the right by 28 bits and bitand with 15
-        markers = (T3Record >> 16) & 0xF  # bitshift of T3Record to the right by 16 bits and bitand with 15
-        dtime = (T3Record >> 16) & 0xFFF  # bitshift of T3Record to the right by 16 bits and bitand with 4095
-
-        OFL = (channel == 15) & (markers == 0)
-
-        calcOFL = OFL * T3WRAPAROUND
-
-        OFLCORR = np.cumsum(calcOFL)
-
-        # truetime for every entry
-        true_nSync = OFLCORR + nsync
-        truetime = true_nSync * globRes * 1e9
-
-        # final data
-        mask = (channel >= 1) & (channel <= 4)
-
-        RawData = np.column_stack([channel[mask] + 1, dtime[mask], truetime[mask]])
-
-        return RawData
-
-    def readHT3(version):
-
-        global inputfile, recNum, oflcorrection, numRecords
-
-        T3WRAPAROUND = 1024
-
-        try:
-            T3Record = np.fromfile(inputfile, dtype=np.uint32, count=numRecords)
-        except:
-            print("Problems reading the file format.")
-            exit(0)
-
-        nsync = T3Record & 0x3FF  # bitand of T3Record with 1023
-        dtime = (T3Record >> 10) & 0x7FFF  # bitshift of T3Record to the right by 10 bits and bitand with 32767
-        channel = (T3Record >> 25) & 0x3F  # bitshift of T3Record to the right by 25 bits and bitand with 63
-        special = (T3Record >> 31) & 0x1  # bitshift of T3Record to the right by 31 bits and bitand with 1
-
-        oldOFL = (special == 1) & (channel == 0x3F) & ((nsync == 0) | (version == 1))  # old overflow
-
-        OFL = (special == 1) & (channel == 0x3F) & ~((nsync == 0) | (version == 1))  # new overflow
-
-        numOFL = OFL.astype(np.uint32) * nsync + oldOFL.astype(np.uint32)  # number of overflows for every entry
-
-        calcOFL = numOFL * T3WRAPAROUND  # overflow delay for every entry
-
-        OFLCORR = np.cumsum(calcOFL)  # cumulative integration of overflow delay
-
-        # truetime for every entry
-        true_nSync = OFLCORR + nsync
-        truetime = true_nSync * globRes * 1e9
-
-        # final data
-        mask = special != 1
-
-        RawData = np.column_stack([channel[mask] + 1, dtime[mask], truetime[mask]])
-
-        return RawData
-
-    oflcorrection = 0
-    dlen = 0
-    recordType = tagValues[tagNames.index("TTResultFormat_TTTRRecType")]
-    if recordType == rtPicoHarp300T2:
-        isT2 = True
-        print("PicoHarp 300 T2 data")
-        print("Data CANNOT be analyzed!")
-    elif recordType == rtPicoHarp300T3:
-        isT2 = False
-        print("PicoHarp 300 T3 data")
-        readPT3()
-    elif recordType == rtHydraHarpT2:
-        isT2 = True
-        print("HydraHarp V1 T2 data")
-        print("Data CANNOT be analyzed!")
-    elif recordType == rtHydraHarpT3:
-        isT2 = False
-        print("HydraHarp V1 T3 data")
-        unit = 'ns'
-        rawData = readHT3(1)
-    elif recordType == rtHydraHarp2T2:
-        isT2 = True
-        print("HydraHarp V2 T2 data")
-        print("Data CANNOT be analyzed!")
-    elif recordType == rtHydraHarp2T3:
-        isT2 = False
-        print("HydraHarp V2 T3 data")
-        unit = 'ns'
-        rawData = readHT3(2)
-    elif recordType == rtTimeHarp260NT3:
-        isT2 = False
-        print("TimeHarp260N T3 data")
-        unit = 'ns'
-        rawData = readHT3(2)
-    elif recordType == rtTimeHarp260NT2:
-        isT2 = True
-        print("TimeHarp260N T2 data")
-        print("Data CANNOT be analyzed!")
-    elif recordType == rtTimeHarp260PT3:
-        isT2 = False
-        print("TimeHarp260P T3 data")
-        unit = 'ns'
-        rawData = readHT3(2)
-    elif recordType == rtTimeHarp260PT2:
-        isT2 = True
-        print("TimeHarp260P T2 data")
-        print("Data CANNOT be analyzed!")
-    elif recordType == rtGenericT3:
-        isT2 = False
-        print("PQ Generic T3 data")
-        unit = 'ns'
-        rawData = readHT3(2)
-    elif recordType == rtGenericT2:
-        isT2 = True
-        print("PQ Generic T2 data")
-        print("Data CANNOT be analyzed!")
-    else:
-        print("ERROR: Unknown record type")
-        exit(0)
-
-    inputfile.close()
-
-    return rawData, unit, globRes, binRes
\ No newline at end of file
+import numpy as np
+import os
+import time
+import struct
+import pickle
+from fractions import Fraction
+
+# Tag Types
+tyEmpty8 = struct.unpack(">i", bytes.fromhex("FFFF0008"))[0]
+tyBool8 = struct.unpack(">i", bytes.fromhex("00000008"))[0]
+tyInt8 = struct.unpack(">i", bytes.fromhex("10000008"))[0]
+tyBitSet64 = struct.unpack(">i", bytes.fromhex("11000008"))[0]
+tyColor8 = struct.unpack(">i", bytes.fromhex("12000008"))[0]
+tyFloat8 = struct.unpack(">i", bytes.fromhex("20000008"))[0]
+tyTDateTime = struct.unpack(">i", bytes.fromhex("21000008"))[0]
+tyFloat8Array = struct.unpack(">i", bytes.fromhex("2001FFFF"))[0]
+tyAnsiString = struct.unpack(">i", bytes.fromhex("4001FFFF"))[0]
+tyWideString = struct.unpack(">i", bytes.fromhex("4002FFFF"))[0]
+tyBinaryBlob = struct.unpack(">i", bytes.fromhex("FFFFFFFF"))[0]
+
+# Record types
+rtPicoHarp300T3 = struct.unpack(">i", bytes.fromhex('00010303'))[0]
+rtPicoHarp300T2 = struct.unpack(">i", bytes.fromhex('00010203'))[0]
+rtHydraHarpT3 = struct.unpack(">i", bytes.fromhex('00010304'))[0]
+rtHydraHarpT2 = struct.unpack(">i", bytes.fromhex('00010204'))[0]
+rtHydraHarp2T3 = struct.unpack(">i", bytes.fromhex('01010304'))[0]
+rtHydraHarp2T2 = struct.unpack(">i", bytes.fromhex('01010204'))[0]
+rtTimeHarp260NT3 = struct.unpack(">i", bytes.fromhex('00010305'))[0]
+rtTimeHarp260NT2 = struct.unpack(">i", bytes.fromhex('00010205'))[0]
+rtTimeHarp260PT3 = struct.unpack(">i", bytes.fromhex('00010306'))[0]
+rtTimeHarp260PT2 = struct.unpack(">i", bytes.fromhex('00010206'))[0]
+rtGenericT3 = struct.unpack(">i", bytes.fromhex('00010307'))[0]  # MultiHarpXXX and PicoHarp330
+rtGenericT2 = struct.unpack(">i", bytes.fromhex('00010207'))[0]  # MultiHarpXXX and PicoHarp330
+
+# record types -> (description, decoder, record version)
+RECORD_FORMATS = {
+    rtPicoHarp300T3: ("PicoHarp 300 T3 data", 'PT3', 1),
+    rtPicoHarp300T2: ("PicoHarp 300 T2 data", 'PT2', 1),
+    rtHydraHarpT3: ("HydraHarp V1 T3 data", 'HT3', 1),
+    rtHydraHarpT2: ("HydraHarp V1 T2 data", 'HT2', 1),
+    rtHydraHarp2T3: ("HydraHarp V2 T3 data", 'HT3', 2),
+    rtHydraHarp2T2: ("HydraHarp V2 T2 data", 'HT2', 2),
+    rtTimeHarp260NT3: ("TimeHarp260N T3 data", 'HT3', 2),
+    rtTimeHarp260NT2: ("TimeHarp260N T2 data", 'HT2', 2),
+    rtTimeHarp260PT3: ("TimeHarp260P T3 data", 'HT3', 2),
+    rtTimeHarp260PT2: ("TimeHarp260P T2 data", 'HT2', 2),
+    rtGenericT3: ("PQ Generic T3 data", 'HT3', 2),
+    rtGenericT2: ("PQ Generic T2 data", 'HT2', 2),
+}
+
+BLOCK_SIZE = 2**22 # number of records decoded at once by the compact reader (16 MB of raw records)
+PHOTON_BYTES = 11 # bytes per photon of the compact photon table (uint8 + uint16 + uint64)
+HEADER_CACHE = "cache" # folder of the header caches
+T2_MICRO_CHANNELS = 4096 # approximate number of synthetic microtime channels per PIE period of T2 data
+T2_PERIOD_DENOMINATOR = 2**20 # maximal denominator of the synthetic PIE period as fraction of time tags
+
+def read_tags(inputfile):
+
+    # Reads the tagged header of an opened PTU file up to and including "Header_End".
+    # Afterwards the file position points to the first TTTR record.
+
+    # Check if inputfile is a valid PTU file
+    # Python strings don't have terminating NULL characters, so they're stripped
+    magic = inputfile.read(8).decode("utf-8").strip('\0')
+    if magic != "PQTTTR":
+        print("ERROR: Magic invalid, this is not a PTU file.")
+        inputfile.close()
+        exit(0)
+
+    version = inputfile.read(8).decode("utf-8").strip('\0')
+
+    # Write the header data to outputfile and also save it in memory.
+    # There's no do ... while in Python, so an if statement inside the while loop
+    # breaks out of it
+    tags = {}  # tagName -> tagValue
+    while True:
+        tagIdent = inputfile.read(32).decode("utf-8").strip('\0')
+        tagIdx = struct.unpack("<i", inputfile.read(4))[0]
+        tagTyp = struct.unpack("<i", inputfile.read(4))[0]
+        if tagIdx > -1:
+            evalName = tagIdent + '(' + str(tagIdx) + ')'
+        else:
+            evalName = tagIdent
+        if tagTyp == tyEmpty8:
+            inputfile.read(8)
+            tags[evalName] = "<empty Tag>"
+        elif tagTyp == tyBool8:
+            tagInt = struct.unpack("<q", inputfile.read(8))[0]
+            if tagInt == 0:
+                tags[evalName] = "False"
+            else:
+                tags[evalName] = "True"
+        elif tagTyp == tyInt8:
+            tagInt = struct.unpack("<q", inputfile.read(8))[0]
+            tags[evalName] = tagInt
+        elif tagTyp == tyBitSet64:
+            tagInt = struct.unpack("<q", inputfile.read(8))[0]
+            tags[evalName] = tagInt
+        elif tagTyp == tyColor8:
+            tagInt = struct.unpack("<q", inputfile.read(8))[0]
+            tags[evalName] = tagInt
+        elif tagTyp == tyFloat8:
+            tagFloat = struct.unpack("<d", inputfile.read(8))[0]
+            tags[evalName] = tagFloat
+        elif tagTyp == tyFloat8Array:
+            tagInt = struct.unpack("<q", inputfile.read(8))[0]
+            tags[evalName] = tagInt
+        elif tagTyp == tyTDateTime:
+            tagFloat = struct.unpack("<d", inputfile.read(8))[0]
+            tagTime = int((tagFloat - 25569) * 86400)
+            tagTime = time.gmtime(tagTime)
+            tags[evalName] = tagTime
+        elif tagTyp == tyAnsiString:
+            tagInt = struct.unpack("<q", inputfile.read(8))[0]
+            tmp_bytes = inputfile.read(tagInt)
+            try:
+                tagString = tmp_bytes.decode('utf-8').strip("\0")
+            except UnicodeDecodeError:
+                tagString = tmp_bytes.decode('latin1', 'ignore').strip("\0")
+            tags[evalName] = tagString
+        elif tagTyp == tyWideString:
+            tagInt = struct.unpack("<q", inputfile.read(8))[0]
+            tagString = inputfile.read(tagInt).decode("utf-16le", errors="ignore").strip("\0")
+            tags[evalName] = tagString
+        elif tagTyp == tyBinaryBlob:
+            tagInt = struct.unpack("<q", inputfile.read(8))[0]
+            inputfile.seek(tagInt, 1)
+            tags[evalName] = tagInt
+        else:
+            print("ERROR: Unknown tag type")
+            exit(0)
+        if tagIdent == "Header_End":
+            break
+
+    return tags
+
+def read_header(fileIN):
+
+    # Reads only the tagged header of a PTU file and stops at "Header_End" -> dict tagName: tagValue
+
+    with open(fileIN, "rb") as inputfile:
+        tags = read_tags(inputfile)
+
+    return tags
+
+def read_headers(folder, cacheFolder=HEADER_CACHE):
+
+    # Headers of all PTU files in a folder -> dict filename: header. The headers are cached in
+    # cacheFolder/Headers_<folder>.pkl keyed by path, size and modification time, so only new or
+    # modified files are parsed again.
+
+    cachePath = os.path.join(cacheFolder, f"Headers_{os.path.basename(os.path.normpath(folder))}.pkl")
+
+    cache = {}
+    if os.path.exists(cachePath):
+        with open(cachePath, 'rb') as f:
+            cache = pickle.load(f)
+
+    headers = {}
+    newCache = {}
+    for fname in [f for f in os.listdir(folder) if f.endswith('.ptu')]:
+
+        path = os.path.abspath(os.path.join(folder, fname))
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+
+        if key in cache:
+            newCache[key] = cache[key]
+        else:
+            newCache[key] = read_header(path)
+
+        headers[fname] = newCache[key]
+
+    if newCache.keys() != cache.keys():
+
+        if not os.path.exists(cacheFolder):
+            os.makedirs(cacheFolder)
+
+        with open(cachePath, 'wb') as f:
+            pickle.dump(newCache, f)
+
+    return headers
+
+def header_summary(headers):
+
+    # Consistency check and memory estimate of the compact photon tables for headers from read_headers
+
+    numRecords = [h["TTResult_NumberOfRecords"] for h in headers.values()]
+    globRes = sorted({h["MeasDesc_GlobalResolution"] for h in headers.values()})
+    binRes = sorted({h["MeasDesc_Resolution"] for h in headers.values()})
+    recordType = sorted({h["TTResultFormat_TTTRRecType"] for h in headers.values()})
+
+    summary = {
+        'numFiles': len(headers),
+        'numRecords': sum(numRecords),
+        'globRes': globRes, # (s)
+        'binRes': binRes, # (s)
+        'recordType': recordType,
+        'consistent': (len(globRes) <= 1) & (len(binRes) <= 1) & (len(recordType) <= 1),
+        'memoryFile': max(numRecords, default=0) * PHOTON_BYTES, # (bytes) upper bound for the largest file
+        'memoryTotal': sum(numRecords) * PHOTON_BYTES, # (bytes) upper bound for the whole folder
+    }
+
+    return summary
+
+def pie_timing(tags, piePeriod=None):
+
+    # Synthetic PIE period of T2 data: T2 time tags (units of MeasDesc_GlobalResolution) are split into a period
+    # number (nsync) and a microtime inside the period. The period (s) is taken from TTResult_SyncRate if not given.
+    # Returns the period as exact fraction of time tags (not necessarily an integer, denominator at most
+    # T2_PERIOD_DENOMINATOR) and the integer microtime channel width in time tags.
+
+    tagRes = tags["MeasDesc_GlobalResolution"]
+
+    if piePeriod is None:
+        periodTags = Fraction(round(1 / tagRes)) / Fraction(tags["TTResult_SyncRate"]).limit_denominator(1000)
+    else:
+        periodTags = Fraction(piePeriod / tagRes)
+
+    periodTags = periodTags.limit_denominator(T2_PERIOD_DENOMINATOR) # (time tags)
+    microTags = max(-(-periodTags.numerator // (periodTags.denominator * T2_MICRO_CHANNELS)), 1) # (time tags)
+
+    return periodTags, microTags
+
+def time_resolution(tags, piePeriod=None):
+
+    # (globRes, binRes) in s of the photon tables: the sync period and the microtime channel width.
+    # For T2 data these are the synthetic PIE period and microtime channels of pie_timing.
+
+    description, decoder, version = RECORD_FORMATS[tags["TTResultFormat_TTTRRecType"]]
+
+    if decoder in ('PT2', 'HT2'):
+
+        periodTags, microTags = pie_timing(tags, piePeriod)
+
+        return float(periodTags) * tags["MeasDesc_GlobalResolution"], microTags * tags["MeasDesc_GlobalResolution"]
+
+    return tags["MeasDesc_GlobalResolution"], tags["MeasDesc_Resolution"]
+
+def decode_PT3(T3Record, version, oflcorrection=0):
+
+    # Decodes a block of PicoHarp 300 T3 records, see decode_HT3
+
+    T3WRAPAROUND = 65536
+
+    nsync = (T3Record & 0xFFFF).astype(np.uint64)  # bitand of T3Record with 65535
+    channel = (T3Record >> 28) & 0xF  # bitshift of T3Record to the right by 28 bits and bitand with 15
+    markers = (T3Record >> 16) & 0xF  # bitshift of T3Record to the right by 16 bits and bitand with 15
+    dtime = (T3Record >> 16) & 0xFFF  # bitshift of T3Record to the right by 16 bits and bitand with 4095
+
+    OFL = (channel == 15) & (markers == 0)
+
+    OFLCORR = np.cumsum(OFL * np.uint64(T3WRAPAROUND), dtype=np.uint64) + np.uint64(oflcorrection)
+
+    # final data - PicoHarp routing channels are already counted from 1
+    mask = (channel >= 1) & (channel <= 4)
+
+    channel = channel[mask].astype(np.uint8)
+    dtime = dtime[mask].astype(np.uint16)
+    true_nSync = OFLCORR[mask] + nsync[mask]
+
+    if len(OFLCORR) > 0:
+        oflcorrection = int(OFLCORR[-1])
+
+    return channel, dtime, true_nSync, oflcorrection
+
+def decode_HT3(T3Record, version, oflcorrection=0):
+
+    # Decodes a block of HT3 records. The overflow correction (sync counts) of all previous blocks is passed in
+    # and the updated value is returned, so consecutive blocks give exact macrotimes.
+
+    T3WRAPAROUND = 1024
+
+    nsync = (T3Record & 0x3FF).astype(np.uint64)  # bitand of T3Record with 1023
+    dtime = (T3Record >> 10) & 0x7FFF  # bitshift of T3Record to the right by 10 bits and bitand with 32767
+    channel = (T3Record >> 25) & 0x3F  # bitshift of T3Record to the right by 25 bits and bitand with 63
+    special = (T3Record >> 31) & 0x1  # bitshift of T3Record to the right by 31 bits and bitand with 1
+
+    oldOFL = (special == 1) & (channel == 0x3F) & ((nsync == 0) | (version == 1))  # old overflow
+
+    OFL = (special == 1) & (channel == 0x3F) & ~((nsync == 0) | (version == 1))  # new overflow
+
+    numOFL = OFL * nsync + oldOFL  # number of overflows for every entry
+
+    OFLCORR = np.cumsum(numOFL * np.uint64(T3WRAPAROUND), dtype=np.uint64) + np.uint64(oflcorrection)  # cumulative integration of overflow delay
+
+    # final data
+    mask = special != 1
+
+    channel = (channel[mask] + 1).astype(np.uint8)
+    dtime = dtime[mask].astype(np.uint16)
+    true_nSync = OFLCORR[mask] + nsync[mask]
+
+    if len(OFLCORR) > 0:
+        oflcorrection = int(OFLCORR[-1])
+
+    return channel, dtime, true_nSync, oflcorrection
+
+def decode_PT2(T2Record, version, oflcorrection=0):
+
+    # Decodes a block of PicoHarp 300 T2 records -> channel, None, time tags (units of globRes), overflow correction
+
+    T2WRAPAROUND = 210698240
+
+    timetag = (T2Record & 0x0FFFFFFF).astype(np.uint64)  # bitand of T2Record with 268435455
+    channel = (T2Record >> 28) & 0xF  # bitshift of T2Record to the right by 28 bits and bitand with 15
+    markers = T2Record & 0xF  # bitand of T2Record with 15
+
+    OFL = (channel == 15) & (markers == 0)
+
+    OFLCORR = np.cumsum(OFL * np.uint64(T2WRAPAROUND), dtype=np.uint64) + np.uint64(oflcorrection)
+
+    # final data
+    mask = channel <= 4
+
+    channel = (channel[mask] + 1).astype(np.uint8)
+    truetime = OFLCORR[mask] + timetag[mask]
+
+    if len(OFLCORR) > 0:
+        oflcorrection = int(OFLCORR[-1])
+
+    return channel, None, truetime, oflcorrection
+
+def decode_HT2(T2Record, version, oflcorrection=0):
+
+    # Decodes a block of HydraHarp, TimeHarp260 and generic T2 records -> channel, None, time tags (units of globRes),
+    # overflow correction
+
+    T2WRAPAROUND_V1 = 33552000
+    T2WRAPAROUND_V2 = 33554432
+
+    timetag = (T2Record & 0x1FFFFFF).astype(np.uint64)  # bitand of T2Record with 33554431
+    channel = (T2Record >> 25) & 0x3F  # bitshift of T2Record to the right by 25 bits and bitand with 63
+    special = (T2Record >> 31) & 0x1  # bitshift of T2Record to the right by 31 bits and bitand with 1
+
+    OFL = (special == 1) & (channel == 0x3F)
+
+    if version == 1:
+        calcOFL = OFL * np.uint64(T2WRAPAROUND_V1)
+    else:
+        calcOFL = OFL * np.maximum(timetag, 1) * np.uint64(T2WRAPAROUND_V2) # a zero count means one overflow
+
+    OFLCORR = np.cumsum(calcOFL, dtype=np.uint64) + np.uint64(oflcorrection)
+
+    # final data - sync (channel 0) and marker events are special records
+    mask = special != 1
+
+    channel = (channel[mask] + 1).astype(np.uint8)
+    truetime = OFLCORR[mask] + timetag[mask]
+
+    if len(OFLCORR) > 0:
+        oflcorrection = int(OFLCORR[-1])
+
+    return channel, None, truetime, oflcorrection
+
+DECODERS = {'PT3': decode_PT3, 'HT3': decode_HT3, 'PT2': decode_PT2, 'HT2': decode_HT2}
+
+def count_photons(records, decoder):
+
+    # number of photon records in a block without decoding it
+    if decoder in ('HT3', 'HT2'):
+        return np.count_nonzero(records < 0x80000000)
+
+    channel = records >> 28
+
+    if decoder == 'PT3':
+        return np.count_nonzero((channel >= 1) & (channel <= 4))
+
+    return np.count_nonzero(channel <= 4)
+
+def map_records(fileIN, piePeriod=None):
+
+    # Parses the header and memory-maps the TTTR records behind "Header_End" without reading them.
+    # Returns the records, the block decoder of the record format and the resolutions of the photon table.
+    # The decoder maps a block of records and the overflow correction of all previous blocks to
+    # channel, dtime, nsync and the updated overflow correction.
+
+    inputfile = open(fileIN, "rb")
+    tags = read_tags(inputfile)
+    offset = inputfile.tell()
+    inputfile.close()
+
+    numRecords = tags["TTResult_NumberOfRecords"]
+    recordType = tags["TTResultFormat_TTTRRecType"]
+
+    if recordType not in RECORD_FORMATS:
+        print("ERROR: Unknown record type")
+        exit(0)
+
+    description, decoder, version = RECORD_FORMATS[recordType]
+    print(description)
+    unit = 'ns'
+
+    globRes, binRes = time_resolution(tags, piePeriod)
+
+    decodeBlock = DECODERS[decoder]
+
+    if decoder in ('PT2', 'HT2'):
+
+        periodTags, microTags = pie_timing(tags, piePeriod)
+
+        num = np.uint64(periodTags.numerator)
+        den = np.uint64(periodTags.denominator)
+
+        def decode(records, oflcorrection):
+
+            channel, _, truetime, oflcorrection = decodeBlock(records, version, oflcorrection)
+
+            # synthetic PIE gating in integers: period number -> nsync, position inside the period -> dtime.
+            # truetime * den / num = (truetime // num) * den + (truetime % num) * den / num, no product overflows.
+            rest = (truetime % num) * den
+            nsync = (truetime // num) * den + rest // num
+            dtime = (rest % num) // (np.uint64(microTags) * den) # (rest % num) / den ... time tags inside the period
+
+            if len(dtime) > 0 and dtime.max() >= T2_MICRO_CHANNELS:
+                print("ERROR: T2 microtime outside of the PIE period")
+                exit(0)
+
+            return channel, dtime.astype(np.uint16), nsync, oflcorrection
+
+    else:
+
+        def decode(records, oflcorrection):
+
+            return decodeBlock(records, version, oflcorrection)
+
+    # do not map beyond the end of incomplete files
+    numRecords = min(numRecords, (os.path.getsize(fileIN) - offset) // 4)
+
+    if numRecords > 0:
+        records = np.memmap(fileIN, dtype=np.uint32, mode='r', offset=offset, shape=(numRecords,))
+    else:
+        records = np.empty(0, dtype=np.uint32) # empty files cannot be mapped
+
+    return records, decoder, decode, unit, globRes, binRes
+
+def read_photons(fileIN, blockSize=BLOCK_SIZE, piePeriod=None):
+
+    # Compact reader: the records after "Header_End" are memory-mapped and decoded in blocks of blockSize records
+    # into a columnar photon table with uint8 channel, uint16 microtime and uint64 sync count (macrotime in units
+    # of globRes). Peak memory stays close to the 11 bytes per photon of the output.
+    # T2 data is gated with a synthetic PIE period (piePeriod in s, default 1/TTResult_SyncRate), see pie_timing.
+
+    records, decoder, decode, unit, globRes, binRes = map_records(fileIN, piePeriod)
+    numRecords = len(records)
+
+    # first pass: number of photon records for preallocation
+    numPhotons = 0
+    for iterB in range(0, numRecords, blockSize):
+        numPhotons += count_photons(records[iterB:iterB + blockSize], decoder)
+
+    photons = {
+        'channel': np.empty(numPhotons, dtype=np.uint8),
+        'dtime': np.empty(numPhotons, dtype=np.uint16),
+        'nsync': np.empty(numPhotons, dtype=np.uint64),
+    }
+
+    # second pass: decoding with overflow correction carried from block to block
+    oflcorrection = 0
+    pos = 0
+    for iterB in range(0, numRecords, blockSize):
+
+        channel, dtime, true_nSync, oflcorrection = decode(records[iterB:iterB + blockSize], oflcorrection)
+
+        photons['channel'][pos:pos + len(channel)] = channel
+        photons['dtime'][pos:pos + len(channel)] = dtime
+        photons['nsync'][pos:pos + len(channel)] = true_nSync
+        pos += len(channel)
+
+    del records
+
+    return photons, unit, globRes, binRes
+
+def iter_photons(fileIN, chunkSize=BLOCK_SIZE, piePeriod=None):
+
+    # Streaming reader: returns a generator of photon tables with chunkSize photons each (the last one may be
+    # shorter) in the layout of read_photons. The overflow correction is carried across chunk boundaries, so the
+    # sync counts are identical to those of read_photons. Only one chunk is held in memory at a time.
+    #
+    # chunks, unit, globRes, binRes = iter_photons(fileIN)
+    # for photons in chunks:
+    #     ...
+
+    records, decoder, decode, unit, globRes, binRes = map_records(fileIN, piePeriod)
+
+    def chunks():
+
+        oflcorrection = 0
+        buffer = [] # decoded blocks not yet handed out
+        numBuffered = 0
+
+        for iterB in range(0, len(records), chunkSize):
+
+            channel, dtime, true_nSync, oflcorrection = decode(records[iterB:iterB + chunkSize], oflcorrection)
+
+            buffer.append((channel, dtime, true_nSync))
+            numBuffered += len(channel)
+
+            while numBuffered >= chunkSize:
+
+                channel, dtime, true_nSync = [np.concatenate(col) for col in zip(*buffer)]
+
+                yield {'channel': channel[:chunkSize], 'dtime': dtime[:chunkSize], 'nsync': true_nSync[:chunkSize]}
+
+                buffer = [(channel[chunkSize:], dtime[chunkSize:], true_nSync[chunkSize:])]
+                numBuffered -= chunkSize
+
+        if numBuffered > 0:
+
+            channel, dtime, true_nSync = [np.concatenate(col) for col in zip(*buffer)]
+
+            yield {'channel': channel, 'dtime': dtime, 'nsync': true_nSync}
+
+    return chunks(), unit, globRes, binRes
+
+def read_data(fileIN):
+
+    # Modified Read_PTU.py script to read T2 and T3 formats of PicoHarp, HydraHarp, TimeHarp and MultiHarp devices
+    # This is demo code. Use at your own risk. No warranties.
+    # Keno Goertz, PicoQUant GmbH, February 2018
+    # Modified by Andreas Hartmann, B CUBE, TU Dresden, July 2025
+
+    # Returns the photons as float array with the columns channel, microtime channel and macrotime (ns).
+    # The decoding is done by read_photons.
+
+    photons, unit, globRes, binRes = read_photons(fileIN)
+
+    # truetime for every entry
+    truetime = photons['nsync'] * globRes * 1e9
+
+    rawData = np.column_stack([photons['channel'], photons['dtime'], truetime])
+
+    return rawData, unit, globRes, binRes
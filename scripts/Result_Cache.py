@@ -0,0 +1,105 @@
+import numpy as np
+import os
+import json
+import pickle
+import hashlib
+from scripts.Burst_Functions import analyse_file
+
+RESULT_CACHE = "cache"
+HASH_BLOCK = 2**24 # (bytes) block size to hash the file content
+CACHE_VERSION = 3 # increase if analyse_file changes its results
+
+def file_hash(fileIN, blockSize=HASH_BLOCK):
+
+    # SHA-256 of the file content, read in blocks
+    h = hashlib.sha256()
+
+    with open(fileIN, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+def content_hashes(folder, cacheFolder=RESULT_CACHE):
+
+    # Content hashes of all PTU files in a folder -> dict filename: hash. Like the headers in read_headers, the
+    # hashes are kept in cacheFolder/Hashes_<folder>.pkl keyed by path, size and modification time, so only
+    # new or modified files are hashed again.
+
+    cachePath = os.path.join(cacheFolder, f"Hashes_{os.path.basename(os.path.normpath(folder))}.pkl")
+
+    cache = {}
+    if os.path.exists(cachePath):
+        with open(cachePath, 'rb') as f:
+            cache = pickle.load(f)
+
+    hashes = {}
+    newCache = {}
+    for fname in [f for f in os.listdir(folder) if f.endswith('.ptu')]:
+
+        path = os.path.abspath(os.path.join(folder, fname))
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+
+        if key in cache:
+            newCache[key] = cache[key]
+        else:
+            newCache[key] = file_hash(path)
+
+        hashes[fname] = newCache[key]
+
+    if newCache.keys() != cache.keys():
+
+        if not os.path.exists(cacheFolder):
+            os.makedirs(cacheFolder)
+
+        with open(cachePath, 'wb') as f:
+            pickle.dump(newCache, f)
+
+    return hashes
+
+def params_key(config):
+
+    # short hash of the analysis parameters and settings, results of other parameters are kept in other folders
+    text = json.dumps({'version': CACHE_VERSION, 'config': config}, sort_keys=True)
+
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+def result_folder(config, cacheFolder=RESULT_CACHE):
+
+    # folder of the cached burst tables of one parameter set
+    return os.path.join(cacheFolder, "Bursts", params_key(config))
+
+def save_result(cachePath, params, lenT):
+
+    # burst table of one file -> npz. The file is written under a temporary name and renamed afterwards, so an
+    # interrupted run never leaves a partial table behind.
+    tmpPath = cachePath + '.tmp'
+
+    with open(tmpPath, 'wb') as f:
+        np.savez(f, lenT=lenT, **params)
+
+    os.replace(tmpPath, cachePath)
+
+def load_result(cachePath):
+
+    # npz -> burst table of one file and its length (s)
+    with np.load(cachePath) as data:
+        params = {key: data[key] for key in data.files if key != 'lenT'}
+        lenT = float(data['lenT'])
+
+    return params, lenT
+
+def analyse_file_cached(fileIN, cachePath, config):
+
+    # analyse_file with the result cache: the table of a file is loaded if it exists, otherwise the file is
+    # analysed and its table is saved right away (checkpoint), so a restarted run continues with the missing files
+    if cachePath is not None and os.path.exists(cachePath):
+        return load_result(cachePath)
+
+    params, lenT = analyse_file(fileIN, config)
+
+    if cachePath is not None:
+        save_result(cachePath, params, lenT)
+
+    return params, lenT
@@ -0,0 +1,128 @@
+import numpy as np
+
+# filter borders of S3 and the burst parameter they act on
+FILTERS = {
+    'NUM_PH': 'Nph',
+    'BRD_S': 'S',
+    'BRD_ALEX2CDE': 'ALEX2CDE',
+    'BRD_E': 'E',
+    'BRD_FRET2CDE': 'FRET2CDE',
+    'RATIO_NGNR': 'ratioDA',
+    'BRD_TAU_D': 'TauD',
+    'BRD_TAU_A': 'TauA0',
+}
+CORRECTIONS = ['ALPHA', 'BETA', 'GAMMA', 'TAU_D0']
+BVA_COLUMNS = ['BVA_W', 'BVA_E', 'BVA_SIGMA'] # burst variance analysis of S2 (missing in older results files)
+
+# dividing a by b without b=0 warning
+def div_array(a, b):
+    return np.divide(a, b, out=np.full_like(a, np.inf, dtype=float), where=b != 0)
+
+class ResultsAnalysis:
+
+    # Corrected FRET efficiency, stoichiometry and burst selection of one results file, kept in memory for repeated
+    # changes of the correction factors and filter borders. The background corrected intensities are computed once,
+    # a correction change recomputes only E and S (or Rel_TauD), a filter change updates the selection only for the
+    # bursts between the old and the new border, found in the sorted values of the filtered parameter.
+    # params ... dict of the correction factors and filter borders of S3 (keys as the parameters of S3)
+
+    def __init__(self, results, background, params):
+
+        self.columns = {key: np.asarray(results[key], dtype=float) for key in ['ID', 'IA', 'IA0', 'BIN_T', 'TauD', 'TauA0', 'ALEX2CDE', 'FRET2CDE', 'PosT']}
+        self.columns.update({key: np.asarray(results[key], dtype=float) for key in BVA_COLUMNS if key in results})
+        self.params = {key: params[key] for key in CORRECTIONS}
+        self.params.update({key: np.array(params[key], dtype=float) for key in FILTERS})
+
+        ID, IA, IA0, BIN_T = (self.columns[key] for key in ['ID', 'IA', 'IA0', 'BIN_T'])
+
+        self.columns['Nph'] = ID + IA + IA0 # total number of photons
+
+        # background corrected fluorescence intensity
+        self.FD = ID - BIN_T * background['BD_mean']
+        self.FA = IA - BIN_T * background['BA_mean']
+        self.FA0 = IA0 - BIN_T * background['BA0_mean']
+
+        self.columns['ratioDA'] = np.log10(div_array(ID, IA) + 1e-10) # intensity ratio
+
+        # number of failed filters of every burst, selected bursts pass all filters
+        self.fails = np.zeros(len(ID), dtype=np.int8)
+        self.order = {}
+
+        self._correct()
+        for key in FILTERS:
+            self._index(FILTERS[key])
+            self.fails[~self._inside(key)] += 1
+
+    def _correct(self):
+
+        # corrected FRET efficiency and stoichiometry, relative fluorescence lifetime of the donor
+        ALPHA, BETA, GAMMA = self.params['ALPHA'], self.params['BETA'], self.params['GAMMA']
+
+        FAc = self.FA - ALPHA * self.FA0 - BETA * self.FD
+        self.columns['E'] = div_array(FAc, FAc + GAMMA * self.FD)
+        self.columns['S'] = div_array(FAc + GAMMA * self.FD, FAc + GAMMA * self.FD + self.FA0)
+        self.columns['Rel_TauD'] = self.columns['TauD'] / self.params['TAU_D0']
+
+    def _index(self, col):
+
+        # sorted index of a parameter (NaN at the end, never inside of a filter)
+        self.order[col] = np.argsort(self.columns[col])
+        self.order[f'{col}_sorted'] = self.columns[col][self.order[col]]
+
+    def _range(self, key, borders):
+
+        # positions of the bursts inside of the borders in the sorted index
+        values = self.order[f'{FILTERS[key]}_sorted']
+        return np.searchsorted(values, borders[0], 'left'), np.searchsorted(values, borders[1], 'right')
+
+    def _inside(self, key):
+
+        inside = np.zeros(len(self.fails), dtype=bool)
+        lo, hi = self._range(key, self.params[key])
+        inside[self.order[FILTERS[key]][lo:hi]] = True
+
+        return inside
+
+    def set_corrections(self, **corrections):
+
+        # new correction factors (ALPHA, BETA, GAMMA, TAU_D0), the filters on E and S are evaluated again
+        self.params.update(corrections)
+
+        keys = [key for key in FILTERS if FILTERS[key] in ['E', 'S']]
+        for key in keys:
+            self.fails[~self._inside(key)] -= 1
+
+        self._correct()
+
+        for key in keys:
+            self._index(FILTERS[key])
+            self.fails[~self._inside(key)] += 1
+
+    def set_filter(self, key, borders):
+
+        # new lower and upper border of one filter: only the bursts leaving or entering the range change
+        order = self.order[FILTERS[key]]
+        a0, a1 = self._range(key, self.params[key])
+        b0, b1 = self._range(key, borders)
+
+        for start, stop, step in [(a0, min(a1, b0), 1), (max(a0, b1), a1, 1), (b0, min(b1, a0), -1), (max(b0, a1), b1, -1)]:
+            if start < stop:
+                self.fails[order[start:stop]] += step
+
+        self.params[key] = np.array(borders, dtype=float)
+
+    def selection(self):
+        return self.fails == 0
+
+    def data(self):
+
+        # all and selected burst parameters for the plots and the export of S3
+        idx = self.selection()
+        data = {key: self.columns[key] for key in ['E', 'S', 'TauD', 'TauA0', 'Rel_TauD', 'ALEX2CDE', 'FRET2CDE', 'PosT'] + BVA_COLUMNS if key in self.columns}
+        data['idx'] = idx
+
+        # data filtering
+        for key in list(data.keys() - {'idx'}):
+            data[f'sel_{key}'] = data[key][idx]
+
+        return data
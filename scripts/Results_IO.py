@@ -0,0 +1,81 @@
+import numpy as np
+import os
+import json
+
+# burst columns of the results and their data types
+RESULT_COLUMNS = {
+    'BN': np.int64,
+    'PosT': np.float64,
+    'BIN_T': np.float64,
+    'ID': np.int64,
+    'IA': np.int64,
+    'IA0': np.int64,
+    'TauD': np.float64,
+    'TauA0': np.float64,
+    'FRET2CDE': np.float64,
+    'ALEX2CDE': np.float64,
+    'DTGR_TR0': np.float64,
+    'BVA_W': np.int64,
+    'BVA_E': np.float64,
+    'BVA_SIGMA': np.float64,
+}
+
+METADATA_FILE = "metadata.json"
+
+# makes it possible to save np arrays in json format
+class NumpyEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        return super().default(obj)
+
+def concat_blocks(blocks):
+
+    # dict of lists of column blocks (e.g. one block per file) -> dict of columns, every column is concatenated
+    # once with its data type from RESULT_COLUMNS
+    columns = {}
+    for key, values in blocks.items():
+        dtype = RESULT_COLUMNS.get(key)
+        columns[key] = np.concatenate(values).astype(dtype, copy=False) if values else np.empty(0, dtype=dtype)
+
+    return columns
+
+def save_results(resultsPath, columns, settings):
+
+    # Binary columnar results: folder resultsPath with one typed .npy file per burst column and the settings
+    # as metadata. Columns that are not listed in RESULT_COLUMNS keep their own data type.
+    if not os.path.exists(resultsPath):
+        os.makedirs(resultsPath)
+
+    for key, values in columns.items():
+        np.save(os.path.join(resultsPath, f"{key}.npy"), np.asarray(values, dtype=RESULT_COLUMNS.get(key)))
+
+    with open(os.path.join(resultsPath, METADATA_FILE), 'w') as f:
+        json.dump({'columns': list(columns), 'settings': settings}, f, indent=4)
+
+def save_results_json(resultsPath, columns):
+
+    # results as json file resultsPath.json (format of the earlier versions)
+    with open(f"{resultsPath}.json", 'w') as f:
+        json.dump(columns, f, indent=4, cls=NumpyEncoder)
+
+def load_results(resultsPath):
+
+    # Burst columns of resultsPath -> dict of arrays and the settings (None for json files). Binary results are
+    # memory-mapped, so only the parts of the columns that are used are read from disk. If there is no binary
+    # result folder, resultsPath.json is loaded.
+    if os.path.isdir(resultsPath):
+
+        with open(os.path.join(resultsPath, METADATA_FILE), 'r') as f:
+            metadata = json.load(f)
+
+        columns = {key: np.load(os.path.join(resultsPath, f"{key}.npy"), mmap_mode='r') for key in metadata['columns']}
+
+        return columns, metadata['settings']
+
+    with open(f"{resultsPath}.json", 'r') as f:
+        results = json.load(f)
+
+    columns = {key: np.array(values, dtype=RESULT_COLUMNS.get(key)) for key, values in results.items()}
+
+    return columns, None
@@ -0,0 +1,217 @@
+import numpy as np
+import os
+import json
+import threading
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from scripts.Scatter2Density import Scatter2Density
+from scripts.Results_IO import NumpyEncoder, load_results
+from scripts.Results_Analysis import ResultsAnalysis
+from scripts.BVA_Functions import BVA_CONFIDENCE, bva_summary, shot_noise
+
+PANEL_SIZE = (16 / 3, 9 / 2) # (inch) size of one panel of the 2 x 3 result figure
+
+def load_result_files(resultsPath, resultsFile):
+
+    # burst columns, background and settings of a results file of S2
+    results = load_results(os.path.join(resultsPath, resultsFile))[0]
+
+    with open(os.path.join(resultsPath, f"BG_{resultsFile[8:]}.json"), 'r') as f:
+        background = json.load(f)
+
+    with open(os.path.join(resultsPath, f"Settings_{resultsFile[8:]}.json"), 'r') as f:
+        settings = json.load(f)
+
+    return results, background, settings
+
+def scatter_densities(data, params):
+
+    # point densities of the four scatter plots, computed once for the figure and all export formats
+    sel_E = data['sel_E']
+    isTau = ~np.isnan(data['sel_Rel_TauD']) # NaN filtered molecules
+
+    dens = {
+        'S': Scatter2Density(sel_E, data['sel_S'], params['DENSITY_METHOD']),
+        'ALEX2CDE': Scatter2Density(sel_E, data['sel_ALEX2CDE'], params['DENSITY_METHOD']),
+        'FRET2CDE': Scatter2Density(sel_E, data['sel_FRET2CDE'], params['DENSITY_METHOD']),
+        'Rel_TauD': Scatter2Density(sel_E[isTau], data['sel_Rel_TauD'][isTau], params['DENSITY_METHOD']),
+    }
+
+    if 'BVA_SIGMA' in data:
+        isBVA = ~np.isnan(data['sel_BVA_SIGMA']) # bursts with at least two BVA windows
+        dens['BVA'] = Scatter2Density(data['sel_BVA_E'][isBVA], data['sel_BVA_SIGMA'][isBVA], params['DENSITY_METHOD'])
+
+    return dens
+
+# FRET efficiency vs. Stoichiometry plot
+def plot_S_vs_E(ax, data, dens, params):
+    ax.scatter(data['E'], data['S'], c='black', s=2)
+    ax.scatter(*dens['S'][:2], c=dens['S'][2], s=7, cmap='jet')
+    ax.set_xlim(-0.1, 1.1)
+    ax.set_ylim(-0.1, 1.1)
+    ax.set_xlabel('FRET efficiency, $E$')
+    ax.set_ylabel('Stoichiometry, $S$')
+
+# FRET efficiency vs. ALEX-2CDE plot
+def plot_ALEX2CDE_vs_E(ax, data, dens, params):
+    ax.scatter(data['E'], data['ALEX2CDE'], c='black', s=2)
+    ax.scatter(*dens['ALEX2CDE'][:2], c=dens['ALEX2CDE'][2], s=7, cmap='jet')
+    ax.set_xlim(-0.1, 1.1)
+    ax.set_ylim(0, 110)
+    ax.set_xlabel('FRET efficiency, $E$')
+    ax.set_ylabel('ALEX-2CDE')
+
+# FRET efficiency vs. FRET-2CDE plot
+def plot_FRET2CDE_vs_E(ax, data, dens, params):
+    ax.scatter(*dens['FRET2CDE'][:2], c=dens['FRET2CDE'][2], s=7, cmap='jet')
+    ax.set_xlim(-0.1, 1.1)
+    ax.set_ylim(0, 110)
+    ax.set_xlabel('FRET efficiency, $E$')
+    ax.set_ylabel('FRET-2CDE')
+
+# FRET efficiency histogram
+def plot_E_histogram(ax, data, dens, params):
+    edgesE = np.arange(-0.1 + params['OFFSET'], 1.1 + params['OFFSET'], params['BIN_SIZE'])
+    ax.hist(data['sel_E'], bins=np.append(edgesE, edgesE[-1] + params['BIN_SIZE']), color='skyblue', edgecolor='black')
+    ax.set_xlim(-0.1, 1.1)
+    ax.set_xlabel('FRET efficiency, $E$')
+    ax.set_ylabel('Number of molecules')
+
+# FRET efficiency vs. relative fluorescence lifetime of the donor
+def plot_RelTauD_vs_E(ax, data, dens, params):
+    ax.scatter(*dens['Rel_TauD'][:2], c=dens['Rel_TauD'][2], s=7, cmap='jet')
+    ax.plot(np.array([0, 1]), np.array([1, 0]), color='black')
+    ax.set_xlim(-0.1, 1.1)
+    ax.set_ylim(-0.1, 1.1)
+    ax.set_xlabel('FRET efficiency, $E$')
+    ax.set_ylabel(r'$\tau_D / \tau_{D0}$')
+
+# Fluorescence lifetime plots
+def plot_Lifetime_histograms(ax, data, dens, params):
+    edgesT = np.arange(0, 10, 0.1)
+    hist_TD_only, _ = np.histogram(data['TauD'][data['S'] > 0.9], bins=np.append(edgesT, edgesT[-1] + 0.1))
+    hist_TA_only, _ = np.histogram(data['TauA0'][data['S'] < 0.2], bins=np.append(edgesT, edgesT[-1] + 0.1))
+    hist_TD, _ = np.histogram(data['sel_TauD'], bins=np.append(edgesT, edgesT[-1] + 0.1))
+
+    ax.step(edgesT, hist_TD_only / np.max(hist_TD_only), where='post', color=(0, 0.75, 0))
+    ax.step(edgesT, hist_TD / np.max(hist_TD), where='post', color=(0.75, 0.75, 0))
+    ax.step(edgesT, hist_TA_only / np.max(hist_TA_only), where='post', color=(0.75, 0, 0))
+    ax.set_xlim(0, 10)
+    ax.set_xlabel(r'$\tau$ (ns)')
+    ax.set_ylabel('number of events')
+    ax.legend(['Donor only', 'Donor - FRET', 'Acceptor only'])
+
+# burst variance analysis: standard deviation of the proximity ratio of the BVA windows vs. proximity ratio
+def plot_BVA(ax, data, dens, params):
+    summary = bva_summary(data['sel_BVA_W'], data['sel_BVA_E'], data['sel_BVA_SIGMA'], np.linspace(0, 1, params['BVA_BINS'] + 1), params['BVA_N'])
+    gridE = np.linspace(0, 1, 201)
+
+    ax.scatter(*dens['BVA'][:2], c=dens['BVA'][2], s=7, cmap='jet')
+    ax.plot(gridE, shot_noise(gridE, params['BVA_N']), color='black')
+    ax.plot(summary['E_mean'], summary['upper_bound'], '--', color='black')
+    ax.plot(summary['E_mean'], summary['sigma'], 'o', color=(0.75, 0, 0.75))
+    ax.set_xlim(-0.05, 1.05)
+    ax.set_ylim(0, 0.5)
+    ax.set_xlabel('proximity ratio, $E_{PR}$')
+    ax.set_ylabel(r'$\sigma(E_{PR})$')
+    ax.legend(['bursts', 'shot noise', f'upper bound ({BVA_CONFIDENCE})', 'E bins'])
+
+# panels of the result figure in the order of the 2 x 3 grid and their export file names
+PANELS = [
+    ("S_vs_E_scatter_plot", plot_S_vs_E),
+    ("ALEX2CDE_vs_E_scatter_plot", plot_ALEX2CDE_vs_E),
+    ("FRET2CDE_vs_E_scatter_plot", plot_FRET2CDE_vs_E),
+    ("E_histogram", plot_E_histogram),
+    ("RelTauD_vs_E_scatter_plot", plot_RelTauD_vs_E),
+    ("Lifetime_histograms", plot_Lifetime_histograms),
+]
+BVA_PANEL = ("BVA_plot", plot_BVA) # separate figure, results files of S2 with burst variance analysis only
+
+def export_panels(data, dens, params, folderOut):
+
+    # every panel is drawn once into its own Agg figure and saved once per selected format
+    formats = [fmt for fmt, key in [('png', 'boolPNG'), ('svg', 'boolSVG')] if params[key]]
+
+    for name, plot in PANELS + ([BVA_PANEL] if 'BVA_SIGMA' in data else []):
+
+        fig = Figure(figsize=PANEL_SIZE)
+        FigureCanvasAgg(fig)
+        plot(fig.add_subplot(), data, dens, params)
+
+        for fmt in formats:
+            fig.savefig(os.path.join(folderOut, f"{name}.{fmt}"), bbox_inches='tight', dpi=300 if fmt == 'png' else 'figure', format=fmt)
+
+def export_tables(data, settings, params, folderOut):
+
+    # burst table of the selected bursts and the correction, filter and analysis settings
+    if params['boolEXCEL']:
+
+        df = pd.DataFrame({
+            "time (s)": data['sel_PosT'],
+            "E": data['sel_E'],
+            "S": data['sel_S'],
+            "Tau_D (ns)": data['sel_TauD'],
+            "Tau_A0 (ns)": data['sel_TauA0'],
+            "ALEX2CDE": data['sel_ALEX2CDE'],
+            "FRET2CDE": data['sel_FRET2CDE']
+        })
+
+        df.to_excel(os.path.join(folderOut, "Results.xlsx"), index=False)
+
+    # generate dictionary from data arrays
+    corr_filter_dict = {
+
+        'alpha': np.array([params['ALPHA']]),
+        'beta' : np.array([params['BETA']]),
+        'gamma' : np.array([params['GAMMA']]),
+        'TauD0' : np.array([params['TAU_D0']]),
+        'number_of_Photons' : params['NUM_PH'],
+        'borders_S' : params['BRD_S'],
+        'borders_ALEX2CDE' : params['BRD_ALEX2CDE'],
+        'borders_E': params['BRD_E'],
+        'borders_FRET2CDE': params['BRD_FRET2CDE'],
+        'borders_NGNR': params['RATIO_NGNR'],
+        'borders_TauD': params['BRD_TAU_D'],
+        'borders_TauA': params['BRD_TAU_A'],
+        'Bin_Size' : np.array([params['BIN_SIZE']]),
+        'Offset' : np.array([params['OFFSET']])
+    }
+
+    with open(os.path.join(folderOut, "CorrFilter_settings.json"), 'w') as f:
+        json.dump(corr_filter_dict, f, indent=4, cls=NumpyEncoder)
+
+    with open(os.path.join(folderOut, "Analysis_settings.json"), 'w') as f:
+        json.dump(settings, f, indent=4)
+
+def export_data(data, dens, settings, params, folderOut):
+
+    # figures and tables of one results file - the tables are written in a thread while the panels are rendered
+    if not (params['boolPNG'] | params['boolSVG'] | params['boolEXCEL']):
+        return
+
+    if not os.path.exists(folderOut):
+        os.makedirs(folderOut)
+
+    tables = threading.Thread(target=export_tables, args=(data, settings, params, folderOut))
+    tables.start()
+
+    export_panels(data, dens, params, folderOut)
+
+    tables.join()
+
+def export_results(resultsFile, params):
+
+    # headless export of one results file of S2 (worker of the batch mode of S3), returns the number of bursts
+    results, background, settings = load_result_files(params['RESULTS_PATH'], resultsFile)
+    params = dict(params, BVA_N=settings.get('BVA_N')) # photons per BVA window of S2
+
+    if not results['BN'].any():
+        return 0
+
+    data = ResultsAnalysis(results, background, params).data()
+    dens = scatter_densities(data, params)
+
+    export_data(data, dens, settings, params, os.path.join(params['PATH_OUT'], resultsFile[8:]))
+
+    return len(data['E'])
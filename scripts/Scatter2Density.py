@@ -1,10 +1,52 @@
 import numpy as np
 from scipy.stats import gaussian_kde
+from scipy.signal import fftconvolve
+from scipy.ndimage import map_coordinates
 
-def Scatter2Density(arrX, arrY):
+GRID_BINS = 256 # number of grid bins per axis of the binned density
 
+def GridDensity(XY, numBins=GRID_BINS):
+
+    # Binned approximation of gaussian_kde(XY)(XY) in O(n + grid): the points are binned onto a 2D grid, the grid is
+    # convolved (FFT) with the Gaussian kernel of gaussian_kde (Scott's rule, covariance of the data) and the density
+    # is interpolated back to the points.
+    numPoints = XY.shape[1]
+
+    kernelCov = np.cov(XY) * numPoints ** (-2 / 6) # Scott's factor n^(-1/(d+4)) for d = 2
+    kernelStd = np.sqrt(np.diag(kernelCov))
+
+    # grid covering the points and the kernel tails
+    lo = XY.min(axis=1) - 4 * kernelStd
+    hi = XY.max(axis=1) + 4 * kernelStd
+    width = (hi - lo) / numBins
+
+    H, _, _ = np.histogram2d(XY[0], XY[1], bins=numBins, range=[[lo[0], hi[0]], [lo[1], hi[1]]])
+
+    # kernel on the grid up to 4 standard deviations
+    half = np.minimum(np.ceil(4 * kernelStd / width).astype(int), numBins)
+    dX, dY = np.meshgrid(np.arange(-half[0], half[0] + 1) * width[0], np.arange(-half[1], half[1] + 1) * width[1], indexing='ij')
+    d = np.stack([dX, dY], axis=-1)
+
+    invCov = np.linalg.inv(kernelCov)
+    kernel = np.exp(-0.5 * np.einsum('...i,ij,...j->...', d, invCov, d)) / (2 * np.pi * np.sqrt(np.linalg.det(kernelCov)))
+
+    density = fftconvolve(H, kernel, mode='same') / numPoints
+
+    # bin centres of the points in grid coordinates
+    coords = (XY - lo[:, None]) / width[:, None] - 0.5
+
+    return np.clip(map_coordinates(density, coords, order=1, mode='nearest'), 0, None)
+
+def Scatter2Density(arrX, arrY, method='kde'):
+
+    # method ... 'kde' -> exact Gaussian KDE at every point (O(n^2)), 'grid' -> binned density (O(n + grid))
     XY = np.vstack([arrX, arrY])
-    z_XY = gaussian_kde(XY)(XY)
+
+    if method == 'grid':
+        z_XY = GridDensity(XY)
+    else:
+        z_XY = gaussian_kde(XY)(XY)
+
     idx_Density_XY = z_XY.argsort()
     arrX, arrY, z_XY = arrX[idx_Density_XY], arrY[idx_Density_XY], z_XY[idx_Density_XY]
 
@@ -0,0 +1,96 @@
+import numpy as np
+from scripts.Photon_Streams import base_traces
+
+# sums collected per grid point: bursts, bursts with E, sum E, sum E^2, bursts with S, sum S, sum S^2
+SWEEP_STATS = ['numB', 'numE', 'sumE', 'sumE2', 'numS', 'sumS', 'sumS2']
+
+def coarsen(trace, k):
+
+    # sums k adjacent bins, a partial last bin is kept like the last bin of a measurement in S2
+    numBins = -(-len(trace) // k)
+    padded = np.zeros(numBins * k, dtype=trace.dtype)
+    padded[:len(trace)] = trace
+
+    return padded.reshape(numBins, k).sum(axis=1)
+
+def bin_scores(I_D, I_A, I_A0, ALGORITHM):
+
+    # score of every bin for the threshold filters of S2: a bin is selected by ALGORITHM if score >= THRE_B
+    if ALGORITHM == 0:
+        return I_D + I_A + I_A0
+    elif ALGORITHM == 1:
+        return np.minimum(I_D + I_A, I_A0)
+    elif ALGORITHM == 2:
+        return I_A0
+    elif ALGORITHM == 3:
+        return I_D + I_A
+    elif ALGORITHM == 4:
+        return I_D
+
+def threshold_sums(score, values, thresholds):
+
+    # Sums of the per-bin values over all bins with score >= threshold for all thresholds at once:
+    # histogram of the (integer) scores weighted by the values, summed from the highest score downwards.
+    # values ... array (number of values, number of bins). Returns an array (number of thresholds, number of values).
+    cut = np.ceil(thresholds).astype(int).clip(0) # integer scores >= threshold
+
+    sums = np.zeros((len(thresholds), len(values)))
+    for iterV, v in enumerate(values):
+        tail = np.cumsum(np.bincount(score, weights=v)[::-1])[::-1]
+        tail = np.concatenate([tail, [0]])
+        sums[:, iterV] = tail[np.minimum(cut, len(tail) - 1)]
+
+    return sums
+
+def sweep_file(fileIN, lut, baseT, BIN_TS, ALGORITHMS, THRESHOLDS):
+
+    # Parameter sweep of one file: the file is read and binned once at baseT (ms), every BIN_T of BIN_TS is built
+    # by summing adjacent bins and every algorithm and threshold is evaluated on these traces.
+    # Returns the sums of SWEEP_STATS as array (BIN_T, ALGORITHM, THRE_B, stat).
+    traces = base_traces(fileIN, lut, baseT)
+
+    sums = np.zeros((len(BIN_TS), len(ALGORITHMS), len(THRESHOLDS), len(SWEEP_STATS)))
+
+    for iterB, BIN_T in enumerate(BIN_TS):
+
+        I_D, I_A, I_A0 = [coarsen(trace, int(round(BIN_T / baseT))) for trace in traces]
+
+        # uncorrected proximity ratio and stoichiometry of every bin
+        NDex = I_D + I_A
+        NAll = NDex + I_A0
+
+        E = np.divide(I_A, NDex, out=np.zeros(len(NDex)), where=NDex > 0)
+        S = np.divide(NDex, NAll, out=np.zeros(len(NAll)), where=NAll > 0)
+
+        values = np.array([np.ones(len(NAll)), NDex > 0, E, E**2, NAll > 0, S, S**2])
+
+        for iterA, ALGORITHM in enumerate(ALGORITHMS):
+            sums[iterB, iterA] = threshold_sums(bin_scores(I_D, I_A, I_A0, ALGORITHM), values, THRESHOLDS)
+
+    return sums
+
+def sweep_summary(sums, BIN_TS, ALGORITHMS, THRESHOLDS):
+
+    # summed statistics of sweep_file (e.g. over all files) -> table with one row per grid point
+    numB, numE, sumE, sumE2, numS, sumS, sumS2 = np.moveaxis(sums, -1, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        E_mean = sumE / numE
+        S_mean = sumS / numS
+        E_std = np.sqrt(np.maximum(sumE2 / numE - E_mean**2, 0))
+        S_std = np.sqrt(np.maximum(sumS2 / numS - S_mean**2, 0))
+
+    grid = np.meshgrid(BIN_TS, ALGORITHMS, THRESHOLDS, indexing='ij')
+
+    table = {
+        'BIN_T': grid[0].ravel(),
+        'ALGORITHM': grid[1].ravel(),
+        'THRE_B': grid[2].ravel(),
+        'Bursts': numB.ravel().astype(int),
+        'E_mean': E_mean.ravel(),
+        'E_std': E_std.ravel(),
+        'S_mean': S_mean.ravel(),
+        'S_std': S_std.ravel(),
+    }
+
+    return table
@@ -80,5 +80,173 @@ def ALEX_2CDE(tAex, tDex, tau):
 
     return (100-50*(BR_Dex+BR_Aex))
 
+def KDE_sums(tEval, tSrc, tau):
+
+    # Linear-time kernel sums sum_j exp(-|tEval[i] - tSrc[j]| / tau) for every tEval[i] (both sorted).
+    # The two-sided exponential kernel splits into a forward and a backward recursion over the merged photon times,
+    # L_k = exp(-(t_k - t_k-1) / tau) * L_k-1 + w_k, which is evaluated as running log-sum-exp to stay finite.
+
+    t = np.concatenate([tSrc, tEval]) / tau
+    t = t - t.min(initial=0)
+    isSrc = np.arange(len(t)) < len(tSrc)
+
+    # sorted runs are merged in linear time, sources come first on equal times
+    order = np.argsort(t, kind='stable')
+    t = t[order]
+    isSrc = isSrc[order]
+
+    fwd = np.logaddexp.accumulate(np.where(isSrc, t, -np.inf)) # log sum_{t_j <= t} exp(t_j)
+    bwd = np.logaddexp.accumulate(np.where(isSrc, -t, -np.inf)[::-1])[::-1] # log sum_{t_j >= t} exp(-t_j)
+
+    # at the positions of the evaluation times the sources are strictly before (fwd) or after (bwd)
+    sums = np.exp(fwd - t) + np.exp(bwd + t)
+
+    out = np.empty(len(tEval))
+    out[order[~isSrc] - len(tSrc)] = sums[~isSrc]
+
+    return out
+
+def nbKDE_sums(t, tau):
+
+    # Linear-time kernel sums of the sorted photon times t with all other photons of t, sum_{j != i}, see KDE_sums.
+    # The self term is left out of the recursions instead of being subtracted afterwards.
+
+    t = t / tau
+    t = t - t.min(initial=0)
+
+    fwd = np.concatenate([[-np.inf], np.logaddexp.accumulate(t)[:-1]]) # log sum_{j < i} exp(t_j)
+    bwd = np.concatenate([np.logaddexp.accumulate(-t[::-1])[::-1][1:], [-np.inf]]) # log sum_{j > i} exp(-t_j)
+
+    return np.exp(fwd - t) + np.exp(bwd + t)
+
+def FRET_2CDE_fast(tA, tD, tau):
+
+    # FRET-2CDE with the linear-time kernel sums, same result as FRET_2CDE
+
+    KDE_DiA = KDE_sums(tD, tA, tau)
+    nbKDE_DiD = (1+2/np.array(len(tD))) * nbKDE_sums(tD, tau)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fracNAN1 = KDE_DiA / (KDE_DiA+nbKDE_DiD)
+    frac1 = fracNAN1[~np.isnan(fracNAN1)]
+
+    if len(frac1) != 0:
+        ED = (1/np.array(len(frac1))) * np.sum(frac1)
+    else:
+        ED = 0
+
+    KDE_AiD = KDE_sums(tA, tD, tau)
+    nbKDE_AiA = (1+2/np.array(len(tA))) * nbKDE_sums(tA, tau)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fracNAN2 = KDE_AiD / (KDE_AiD+nbKDE_AiA)
+    frac2 = fracNAN2[~np.isnan(fracNAN2)]
+
+    if len(frac2) != 0:
+        OneMinusEA = (1/np.array(len(frac2))) * np.sum(frac2)
+    else:
+        OneMinusEA = 0
+
+    value = 110-100*(ED + OneMinusEA)
+
+    if (np.isnan(value)) | (value < 0):
+        value = 0
+    return value
+
+def ALEX_2CDE_fast(tAex, tDex, tau):
+
+    # ALEX-2CDE with the linear-time kernel sums, same result as ALEX_2CDE
+
+    if len(tAex) == 0:
+        BR_Dex = 0
+    else:
+        BR_Dex = (1/len(tAex)) * np.sum(KDE_sums(tDex, tAex, tau)/(1+nbKDE_sums(tDex, tau)))
+
+    if len(tDex) == 0:
+        BR_Aex = 0
+    else:
+        BR_Aex = (1/len(tDex)) * np.sum(KDE_sums(tAex, tDex, tau)/(1+nbKDE_sums(tAex, tau)))
+
+    return (100-50*(BR_Dex+BR_Aex))
+
+KERNEL_GAP = 746 # (tau) exp(-746) underflows to zero, so kernels of neighbouring bursts do not overlap
+
+def burst_shifts(tX, offX, tY, offY, tau):
+
+    # Shifts (units of tau) which place the bursts one after another with KERNEL_GAP in between.
+    # t are the concatenated photon times of all bursts relative to the burst starts, off the CSR offsets.
+    last = np.zeros(len(offX) - 1)
+
+    for t, off in ((tX, offX), (tY, offY)):
+        nonEmpty = off[1:] > off[:-1]
+        last[nonEmpty] = np.maximum(last[nonEmpty], t[off[1:][nonEmpty] - 1] / tau)
+
+    return np.concatenate([[0], np.cumsum(last + KERNEL_GAP)[:-1]])
+
+def segment_nanmean(values, ids, numB):
+
+    # mean of the non-NaN values of every burst, 0 if a burst has none
+    valid = ~np.isnan(values)
+    sums = np.bincount(ids[valid], weights=values[valid], minlength=numB)
+    counts = np.bincount(ids[valid], minlength=numB)
+
+    return np.divide(sums, counts, out=np.zeros(numB), where=counts > 0)
+
+def FRET_2CDE_batch(tA, offA, tD, offD, tau):
+
+    # FRET-2CDE of all bursts in one call. tA and tD are the concatenated photon times of all bursts relative
+    # to the burst starts (sorted inside each burst) and offA, offD the offsets of the bursts (CSR layout,
+    # length number of bursts + 1). Bursts without acceptor or donor photons get 0 as in S2.
+
+    numB = len(offA) - 1
+    nA, nD = np.diff(offA), np.diff(offD)
+    idA, idD = np.repeat(np.arange(numB), nA), np.repeat(np.arange(numB), nD)
+
+    # all bursts on one time axis (units of tau) with non-overlapping kernels
+    shift = burst_shifts(tA, offA, tD, offD, tau)
+    sA = tA / tau + shift[idA]
+    sD = tD / tau + shift[idD]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+
+        KDE_DiA = KDE_sums(sD, sA, 1)
+        nbKDE_DiD = (1+2/nD[idD]) * nbKDE_sums(sD, 1)
+        ED = segment_nanmean(KDE_DiA / (KDE_DiA+nbKDE_DiD), idD, numB)
+
+        KDE_AiD = KDE_sums(sA, sD, 1)
+        nbKDE_AiA = (1+2/nA[idA]) * nbKDE_sums(sA, 1)
+        OneMinusEA = segment_nanmean(KDE_AiD / (KDE_AiD+nbKDE_AiA), idA, numB)
+
+    value = 110-100*(ED + OneMinusEA)
+
+    value[np.isnan(value) | (value < 0)] = 0
+    value[(nA == 0) | (nD == 0)] = 0
+
+    return value
+
+def ALEX_2CDE_batch(tAex, offAex, tDex, offDex, tau):
+
+    # ALEX-2CDE of all bursts in one call, layout as in FRET_2CDE_batch.
+    # Bursts without photons after acceptor or donor excitation get 100 as in S2.
+
+    numB = len(offAex) - 1
+    nAex, nDex = np.diff(offAex), np.diff(offDex)
+    idAex, idDex = np.repeat(np.arange(numB), nAex), np.repeat(np.arange(numB), nDex)
+
+    shift = burst_shifts(tAex, offAex, tDex, offDex, tau)
+    sAex = tAex / tau + shift[idAex]
+    sDex = tDex / tau + shift[idDex]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+
+        BR_Dex = np.bincount(idDex, weights=KDE_sums(sDex, sAex, 1)/(1+nbKDE_sums(sDex, 1)), minlength=numB) / nAex
+        BR_Aex = np.bincount(idAex, weights=KDE_sums(sAex, sDex, 1)/(1+nbKDE_sums(sAex, 1)), minlength=numB) / nDex
+
+    value = 100-50*(BR_Dex+BR_Aex)
+
+    value[(nAex == 0) | (nDex == 0)] = 100
+
+    return value
+
 if __name__ == '__main__':
     print('In main')
@@ -0,0 +1,134 @@
+import numpy as np
+import os
+import json
+import hashlib
+from scripts.Photon_Streams import base_traces
+
+PYRAMID_CACHE = "cache"
+PYRAMID_FACTOR = 4 # number of bins of a level that are merged into one bin of the next level
+MIN_LEVEL_BINS = 1000 # the coarsest level has at most this number of bins
+TRACE_STREAMS = ['D', 'A', 'A0', 'All']
+
+def pyramid_levels(trace, factor=PYRAMID_FACTOR, minBins=MIN_LEVEL_BINS):
+
+    # Decimation levels of a time trace: level 0 is the trace itself, every further level merges factor bins
+    # of the previous level into one bin with their sum and their minimum and maximum base bin.
+    # Returns a list of dicts with 'sum', 'min' and 'max' per level.
+    levels = [{'sum': trace, 'min': trace, 'max': trace}]
+
+    while len(levels[-1]['sum']) > minBins:
+
+        prev = levels[-1]
+        numBins = -(-len(prev['sum']) // factor)
+        pad = numBins * factor - len(prev['sum'])
+
+        # the partial last bin is padded with its own last value, so minimum and maximum stay unchanged
+        level = {}
+        for key, reduce in [('sum', np.sum), ('min', np.min), ('max', np.max)]:
+            values = np.concatenate([prev[key], np.full(pad, prev[key][-1] if key != 'sum' else 0, dtype=prev[key].dtype)])
+            level[key] = reduce(values.reshape(numBins, factor), axis=1)
+
+        levels.append(level)
+
+    return levels
+
+def pyramid_key(folder, settings, baseT):
+
+    # short hash of the file list (name, size, modification time), the settings and the finest bin time
+    files = []
+    for fname in sorted(f for f in os.listdir(folder) if f.endswith('.ptu')):
+        stat = os.stat(os.path.join(folder, fname))
+        files.append([fname, stat.st_size, stat.st_mtime_ns])
+
+    text = json.dumps({'files': files, 'settings': settings, 'baseT': baseT}, sort_keys=True)
+
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+def build_pyramid(folder, lut, settings, baseT, cacheFolder=PYRAMID_CACHE):
+
+    # Trace pyramid of all PTU files of a folder (files one after another) for the streams D, A, A0 and All, stored
+    # as one .npy file per stream, level and statistic in cacheFolder/Trace_<folder>/<key>. An existing pyramid of
+    # the same files, settings and baseT (ms) is reused. Returns the path of the pyramid.
+    pyramidPath = os.path.join(cacheFolder, f"Trace_{os.path.basename(os.path.normpath(folder))}", pyramid_key(folder, settings, baseT))
+    metaPath = os.path.join(pyramidPath, "metadata.json")
+
+    if os.path.exists(metaPath):
+        return pyramidPath
+
+    contPath = [f for f in os.listdir(folder) if f.endswith('.ptu')]
+
+    if not contPath:
+        print(f"ERROR: no PTU files in {folder}")
+        exit(0)
+
+    traces = {key: [] for key in TRACE_STREAMS}
+    fileStart = [0]
+
+    for fname in contPath:
+
+        I_D, I_A, I_A0 = base_traces(os.path.join(folder, fname), lut, baseT)
+
+        for key, trace in zip(TRACE_STREAMS, [I_D, I_A, I_A0, I_D + I_A + I_A0]):
+            traces[key].append(trace.astype(np.int32))
+
+        fileStart.append(fileStart[-1] + len(I_D))
+
+    if not os.path.exists(pyramidPath):
+        os.makedirs(pyramidPath)
+
+    for key in TRACE_STREAMS:
+
+        levels = pyramid_levels(np.concatenate(traces[key]))
+        traces[key] = None
+
+        for iterL, level in enumerate(levels):
+            for stat in ['sum', 'min', 'max'] if iterL else ['sum']:
+                np.save(os.path.join(pyramidPath, f"{key}_L{iterL}_{stat}.npy"), level[stat])
+
+    # metadata last - a pyramid without metadata is incomplete and built again
+    with open(metaPath, 'w') as f:
+        json.dump({'files': contPath, 'fileStart': fileStart, 'baseT': baseT, 'factor': PYRAMID_FACTOR, 'numLevels': len(levels)}, f, indent=4)
+
+    return pyramidPath
+
+def load_pyramid(pyramidPath):
+
+    # metadata and memory-mapped levels of a pyramid: levels[stream][level][stat]
+    with open(os.path.join(pyramidPath, "metadata.json"), 'r') as f:
+        meta = json.load(f)
+
+    levels = {}
+    for key in TRACE_STREAMS:
+        levels[key] = []
+        for iterL in range(meta['numLevels']):
+            level = {}
+            for stat in ['sum', 'min', 'max']:
+                path = os.path.join(pyramidPath, f"{key}_L{iterL}_{stat if iterL else 'sum'}.npy")
+                level[stat] = np.load(path, mmap_mode='r')
+            levels[key].append(level)
+
+    return meta, levels
+
+def view_level(meta, t0, t1, maxPoints):
+
+    # finest level with at most maxPoints bins in the time range [t0, t1] (s)
+    numBins = (t1 - t0) / (meta['baseT'] * 1e-3)
+
+    level = int(np.ceil(np.log(max(numBins / maxPoints, 1)) / np.log(meta['factor'])))
+
+    return min(level, meta['numLevels'] - 1)
+
+def view_trace(meta, levels, key, level, t0, t1):
+
+    # bins of one stream and level in the time range [t0, t1] (s): bin start times (s), mean intensity of the bins
+    # and minimum and maximum intensity of their base bins (kHz)
+    binT = meta['baseT'] * 1e-3 * meta['factor']**level # (s)
+    data = levels[key][level]
+
+    lo = max(int(t0 // binT), 0)
+    hi = min(int(t1 // binT) + 2, len(data['sum']))
+
+    t = np.arange(lo, hi) * binT # (s)
+    mean = np.asarray(data['sum'][lo:hi]) / meta['factor']**level / meta['baseT'] # (kHz)
+
+    return t, mean, np.asarray(data['min'][lo:hi]) / meta['baseT'], np.asarray(data['max'][lo:hi]) / meta['baseT']